@@ -0,0 +1,291 @@
+from time import perf_counter
+
+import click
+import numpy as np
+
+from game import (
+    ACTION_CODES,
+    ACTIONS_BY_CODE,
+    CASTLE,
+    CONQUER,
+    CONQUER_COSTS,
+    DEFENDER_STRUCTURES,
+    FARM,
+    FORT,
+    HARVEST,
+    HARVEST_PRODUCTION_BY_CODE,
+    LAND,
+    STRUCTURE_CODES,
+    STRUCTURE_COST,
+    STRUCTURES,
+    STRUCTURES_BY_CODE,
+    TILES_PER_CASTLE_LIMIT,
+    ToE,
+)
+
+NO_ACTION = -1
+
+UNDEFENDED_CONQUER_COSTS = np.array([
+    CONQUER_COSTS[structure][0] if isinstance(CONQUER_COSTS[structure], tuple) else CONQUER_COSTS[structure]
+    for structure in STRUCTURES_BY_CODE
+])
+DEFENDED_CONQUER_COSTS = np.array([
+    CONQUER_COSTS[structure][1] if isinstance(CONQUER_COSTS[structure], tuple) else CONQUER_COSTS[structure]
+    for structure in STRUCTURES_BY_CODE
+])
+DEFENDERS = np.array([structure in DEFENDER_STRUCTURES for structure in STRUCTURES_BY_CODE])
+PRODUCTION = np.array(HARVEST_PRODUCTION_BY_CODE)
+
+# indexed by action code
+BUILD_COSTS = np.array([STRUCTURE_COST.get(action_type, 0) for action_type in ACTIONS_BY_CODE])
+BUILT_STRUCTURES = np.array([STRUCTURE_CODES.get(action_type, 0) for action_type in ACTIONS_BY_CODE])
+BUILD_ACTIONS = np.array([action_type in STRUCTURES for action_type in ACTIONS_BY_CODE])
+
+ADJACENT_OFFSETS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+class BatchedToE:
+    """
+    Many games of Terminal of Empires (all with the same map size and number of players), stored as
+    stacked arrays so the rules are applied to all of them at once with numpy.
+    Tiles are indexed by y * width + x (like in the WorldGrid), owners are player numbers (1 to
+    players, 0 for neutral) and actions use the codes in game.ACTION_CODES.
+    """
+    def __init__(self, games, width, height, players):
+        self.games = games
+        self.width = width
+        self.height = height
+        self.players = players
+
+        self.game_indexes = np.arange(games)
+        self.structures = np.zeros((games, width * height), dtype=np.uint8)
+        self.owners = np.zeros((games, width * height), dtype=np.uint8)
+        self.resources = np.zeros((games, players + 1), dtype=np.int64)
+        self.alive = np.zeros((games, players + 1), dtype=bool)
+
+    def reset(self, castles=None, seed=None):
+        """
+        Start all the games again. The initial castles can be specified as a (games, players) array
+        of tile indexes, otherwise they are placed at random.
+        """
+        if castles is None:
+            rng = np.random.default_rng(seed)
+            castles = rng.random(self.structures.shape).argsort(axis=1)[:, :self.players]
+
+        self.structures[:] = STRUCTURE_CODES[LAND]
+        self.owners[:] = 0
+        self.resources[:] = 0
+        self.alive[:] = False
+        self.alive[:, 1:] = True
+
+        castle_games = np.repeat(self.game_indexes, self.players)
+        self.structures[castle_games, castles.ravel()] = STRUCTURE_CODES[CASTLE]
+        self.owners[castle_games, castles.ravel()] = np.tile(np.arange(1, self.players + 1), self.games)
+
+        return castles
+
+    def step(self, players, actions, xs, ys):
+        """
+        Apply one action in each game: players, actions (codes, or NO_ACTION) and the x and y of
+        the positions are arrays with one value per game. Actions of dead players are ignored.
+        Return a boolean array with the games where the action succeeded.
+        """
+        games = self.game_indexes
+        structures = self.structures
+        owners = self.owners
+
+        on_map = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        indexes = np.where(on_map, ys * self.width + xs, 0)
+        target_owners = owners[games, indexes]
+        target_structures = structures[games, indexes]
+        player_resources = self.resources[games, players]
+        valid = self.alive[games, players] & (actions != NO_ACTION)
+        actions = np.where(valid, actions, 0)
+
+        # conquer
+        in_range = np.zeros(self.games, dtype=bool)
+        defended = np.zeros(self.games, dtype=bool)
+        for dx, dy in ADJACENT_OFFSETS:
+            adjacent_xs = xs + dx
+            adjacent_ys = ys + dy
+            adjacent_on_map = (
+                on_map
+                & (adjacent_xs >= 0) & (adjacent_xs < self.width)
+                & (adjacent_ys >= 0) & (adjacent_ys < self.height)
+            )
+            adjacent_indexes = np.where(adjacent_on_map, adjacent_ys * self.width + adjacent_xs, 0)
+            adjacent_owners = owners[games, adjacent_indexes]
+            adjacent_structures = structures[games, adjacent_indexes]
+
+            in_range |= adjacent_on_map & (adjacent_owners == players)
+            defended |= adjacent_on_map & DEFENDERS[adjacent_structures] & (adjacent_owners == target_owners)
+
+        conquer_costs = np.where(
+            defended,
+            DEFENDED_CONQUER_COSTS[target_structures],
+            UNDEFENDED_CONQUER_COSTS[target_structures],
+        )
+        conquered = (
+            valid & (actions == ACTION_CODES[CONQUER]) & on_map & (target_owners != players)
+            & in_range & (player_resources >= conquer_costs)
+        )
+
+        # build
+        build_costs = BUILD_COSTS[actions]
+        built = (
+            valid & BUILD_ACTIONS[actions] & (player_resources >= build_costs) & on_map
+            & (target_owners == players)
+        )
+
+        castle_builds = built & (actions == ACTION_CODES[CASTLE])
+        if castle_builds.any():
+            owned = owners[castle_builds] == players[castle_builds, None]
+            owned_tiles = owned.sum(axis=1)
+            owned_castles = (owned & (structures[castle_builds] == STRUCTURE_CODES[CASTLE])).sum(axis=1)
+            too_many_castles = (owned_castles > 0) & (owned_tiles <= owned_castles * TILES_PER_CASTLE_LIMIT)
+            built[np.flatnonzero(castle_builds)[too_many_castles]] = False
+
+        # harvest
+        harvested = valid & (actions == ACTION_CODES[HARVEST])
+        if harvested.any():
+            production = (
+                (owners[harvested] == players[harvested, None]) * PRODUCTION[structures[harvested]]
+            ).sum(axis=1)
+            self.resources[games[harvested], players[harvested]] += production
+
+        structures[games[conquered], indexes[conquered]] = STRUCTURE_CODES[LAND]
+        owners[games[conquered], indexes[conquered]] = players[conquered]
+        self.resources[games[conquered], players[conquered]] -= conquer_costs[conquered]
+
+        structures[games[built], indexes[built]] = BUILT_STRUCTURES[actions[built]]
+        self.resources[games[built], players[built]] -= build_costs[built]
+
+        return conquered | built | harvested
+
+    def end_turn(self):
+        """
+        Mark as dead the players without castles, and return a (games, players + 1) boolean array
+        with the players that died.
+        """
+        castle_owners = np.where(self.structures == STRUCTURE_CODES[CASTLE], self.owners, 0)
+        has_castles = np.zeros_like(self.alive)
+        has_castles[np.repeat(self.game_indexes, castle_owners.shape[1]), castle_owners.ravel()] = True
+
+        died = self.alive & ~has_castles
+        self.alive &= has_castles
+        return died
+
+
+def random_actions(batch, players, rng):
+    """
+    Random actions for a batch of games, mostly around the tiles of each player so many of them
+    are valid (and mostly not building on top of their own castles, so games last longer).
+    """
+    action_weights = {CONQUER: 0.4, HARVEST: 0.3, FARM: 0.1, FORT: 0.1, CASTLE: 0.05}
+    actions = rng.choice(
+        [NO_ACTION] + [ACTION_CODES[action_type] for action_type in action_weights],
+        p=[0.05] + list(action_weights.values()),
+        size=batch.games,
+    )
+    owned_scores = (batch.owners == players[:, None]) * rng.random(batch.owners.shape)
+    near = owned_scores.argmax(axis=1)
+    offsets = np.array(((0, 0),) + ADJACENT_OFFSETS)[rng.integers(0, 5, size=batch.games)]
+    xs = near % batch.width + offsets[:, 0]
+    ys = near // batch.width + offsets[:, 1]
+
+    far = rng.random(batch.games) < 0.1
+    xs[far] = rng.integers(-1, batch.width + 1, size=far.sum())
+    ys[far] = rng.integers(-1, batch.height + 1, size=far.sum())
+
+    on_castles = (
+        (offsets == 0).all(axis=1)
+        & (batch.structures[batch.game_indexes, near] == STRUCTURE_CODES[CASTLE])
+        & BUILD_ACTIONS[np.maximum(actions, 0)]
+        & (rng.random(batch.games) < 0.9)
+    )
+    actions[on_castles & ~far] = ACTION_CODES[HARVEST]
+
+    return actions, xs, ys
+
+
+def differential_check(games, width, height, players, turns, seed=0):
+    """
+    Play random actions in a batch of games and in the same games with ToE, checking that both
+    produce the same results and states after every turn. Raise AssertionError on any difference.
+    """
+    rng = np.random.default_rng(seed)
+    batch = BatchedToE(games, width, height, players)
+    castles = batch.reset(seed=seed)
+
+    toes = []
+    for game in range(games):
+        toe = ToE(width, height, log_format="none")
+        for player in range(players):
+            toe.add_player(f"p{player + 1}", "passive", castle_position=toe.world.position(castles[game, player]))
+        toes.append(toe)
+
+    for turn in range(turns):
+        orders = rng.permuted(np.tile(np.arange(1, players + 1), (games, 1)), axis=1)
+        for order in range(players):
+            turn_players = orders[:, order]
+            actions, xs, ys = random_actions(batch, turn_players, rng)
+            batch_results = batch.step(turn_players, actions, xs, ys)
+
+            for game, toe in enumerate(toes):
+                player = toe.players[f"p{turn_players[game]}"]
+                if not player.alive or actions[game] == NO_ACTION:
+                    toe_ok = False
+                else:
+                    action_type = ACTIONS_BY_CODE[actions[game]]
+                    position = None if action_type == HARVEST else (int(xs[game]), int(ys[game]))
+                    toe_ok, _ = toe.apply_action(player, (action_type, position))
+
+                assert toe_ok == batch_results[game], f"game {game}, turn {turn}: action {action_type} {position} of {player.name} differs"
+
+        batch.end_turn()
+        for game, toe in enumerate(toes):
+            toe.update_alive_players()
+
+            assert bytes(toe.world.structures) == batch.structures[game].tobytes(), f"game {game}, turn {turn}: structures differ"
+            assert bytes(toe.world.owners) == batch.owners[game].tobytes(), f"game {game}, turn {turn}: owners differ"
+            for number, player in enumerate(toe.players.values(), start=1):
+                assert player.resources == batch.resources[game, number], f"game {game}, turn {turn}: resources of {player.name} differ"
+                assert player.alive == batch.alive[game, number], f"game {game}, turn {turn}: alive status of {player.name} differs"
+
+
+@click.command()
+@click.option("--games", type=int, default=64, help="Number of games in the batch.")
+@click.option("--width", type=int, default=40, help="The width of the map.")
+@click.option("--height", type=int, default=20, help="The height of the map.")
+@click.option("--players", type=int, default=4, help="Number of players of each game.")
+@click.option("--turns", type=int, default=200, help="Number of turns to play.")
+@click.option("--seed", type=int, default=0, help="Seed for the random actions.")
+@click.option("--check", is_flag=True, help="Check that the batched games match ToE rule for rule, instead of measuring speed.")
+def main(games, width, height, players, turns, seed, check):
+    """
+    Measure the speed of the batched games with random actions, or check that they follow the same
+    rules of ToE.
+    """
+    if check:
+        differential_check(games, width, height, players, turns, seed)
+        print(f"{games} games of {turns} turns matched ToE exactly.")
+        return
+
+    rng = np.random.default_rng(seed)
+    batch = BatchedToE(games, width, height, players)
+    batch.reset(seed=seed)
+
+    start = perf_counter()
+    for _ in range(turns):
+        for player in range(1, players + 1):
+            turn_players = np.full(games, player)
+            batch.step(turn_players, *random_actions(batch, turn_players, rng))
+        batch.end_turn()
+    elapsed = perf_counter() - start
+
+    actions_played = games * turns * players
+    print(f"{actions_played} actions in {elapsed:.2f} seconds ({actions_played / elapsed:.0f} actions/second)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import glob
+import json
+import os
+import queue
+import threading
+import uuid
+from itertools import count
+
+import numpy as np
+
+from game import ACTION_CODES, Position
+
+NO_ACTION = -1
+NO_POSITION = (-1, -1)
+
+SHARD_COLUMNS = ("turn", "player", "structures", "owners", "resources", "action", "position")
+
+
+class DatasetRecorder:
+    """
+    Records the turns of a game as a training dataset of (observation, action) rows, plus the
+    outcome of the game.
+    The observation of each turn is a pair of (height, width) planes with the structure codes and
+    the owners (0 neutral, 1 the player itself, 2+ the other players), plus the resources of the
+    player. The outcome is the score of each player in the game (1 split among the winners).
+
+    Rows are written as the game goes: every shard_size rows a background thread writes them to a
+    compressed .npz shard, so the game loop doesn't wait for compression or disk writes. When the
+    game ends, its outcome is written to a separate json file. Shards and outcome are named after
+    a random id of the game, so games recorded in parallel (or in different runs) never collide,
+    and are joined by that id (see load_dataset).
+    """
+    def __init__(self, directory, game_number=0, seed=None, shard_size=10000, queue_size=8):
+        self.directory = directory
+        self.shard_size = shard_size
+        os.makedirs(directory, exist_ok=True)
+
+        # 63 random bits, so it fits in a signed int64 column
+        self.game_id = uuid.uuid4().int >> 65
+        self.game_number = game_number
+        self.seed = seed
+
+        self.rows = []
+        self.map_size = None
+        self.owner_tables = {}
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.shards_count = count()
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def game_path(self, suffix):
+        """
+        Path of a file of the recorded game.
+        """
+        return os.path.join(self.directory, f"game-{self.game_id:016x}{suffix}")
+
+    def record_turn(self, toe, player, action):
+        """
+        Record the observation of a player and the action it chose.
+        """
+        owner_table = self.owner_tables.get(player.name)
+        if owner_table is None:
+            owner_table = self.owner_tables[player.name] = self.build_owner_table(toe, player)
+
+        try:
+            action_type, position = action
+            action_code = ACTION_CODES[action_type]
+            position = NO_POSITION if position is None else tuple(Position(*position))
+        except (TypeError, ValueError, KeyError):
+            action_code, position = NO_ACTION, NO_POSITION
+
+        self.map_size = toe.map_size
+        self.rows.append((
+            toe.turn_number,
+            toe.world.owner_ids[player.name],
+            bytes(toe.world.structures),
+            toe.world.owners.translate(owner_table),
+            player.resources,
+            action_code,
+            position,
+        ))
+
+        if len(self.rows) >= self.shard_size:
+            self.flush()
+
+    def build_owner_table(self, toe, player):
+        """
+        Translation table from owner ids to owners relative to the player.
+        """
+        player_id = toe.world.owner_ids[player.name]
+        other_ids = [owner_id for owner_id in range(1, len(toe.world.owner_names)) if owner_id != player_id]
+
+        table = bytearray(range(256))
+        table[player_id] = 1
+        for relative_id, owner_id in enumerate(other_ids, start=2):
+            table[owner_id] = relative_id
+        return bytes(table)
+
+    def flush(self):
+        """
+        Send the pending rows to the writer, as a shard.
+        """
+        if self.rows:
+            self.queue.put((self.write_shard, (self.rows, self.map_size)))
+            self.rows = []
+
+    def record_outcome(self, toe, winners):
+        """
+        Record the end of the game: its last rows, and the score of each player.
+        """
+        self.flush()
+
+        winner_names = {winner.name for winner in winners}
+        outcome = {
+            "game": self.game_id,
+            "game_number": self.game_number,
+            "seed": self.seed,
+            "turns": toe.turn_number,
+            "players": {
+                name: {
+                    "player": toe.world.owner_ids[name],
+                    "outcome": 1 / len(winner_names) if name in winner_names else 0,
+                }
+                for name in toe.players
+            },
+        }
+        self.queue.put((self.write_outcome, (outcome,)))
+
+    def write_loop(self):
+        """
+        Background loop that runs the writes sent to the queue, in order.
+        """
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            write, args = item
+            write(*args)
+
+    def write_shard(self, rows, map_size):
+        """
+        Write rows as a compressed .npz shard.
+        """
+        width, height = map_size
+        columns = dict(zip(SHARD_COLUMNS, zip(*rows)))
+
+        np.savez_compressed(
+            self.game_path(f"-{next(self.shards_count):05}.npz"),
+            game=np.full(len(rows), self.game_id, dtype=np.int64),
+            turn=np.array(columns["turn"], dtype=np.int32),
+            player=np.array(columns["player"], dtype=np.uint8),
+            structures=np.frombuffer(b"".join(columns["structures"]), dtype=np.uint8).reshape(-1, height, width),
+            owners=np.frombuffer(b"".join(columns["owners"]), dtype=np.uint8).reshape(-1, height, width),
+            resources=np.array(columns["resources"], dtype=np.int64),
+            action=np.array(columns["action"], dtype=np.int8),
+            position=np.array(columns["position"], dtype=np.int32),
+        )
+
+    def write_outcome(self, outcome):
+        """
+        Write the outcome of the game, after all its shards (so a game with an outcome file is
+        complete).
+        """
+        with open(self.game_path(".outcome.json"), "w") as outcome_file:
+            json.dump(outcome, outcome_file)
+
+    def close(self):
+        """
+        Write the pending rows (even if the game didn't end), and wait for the writer to finish.
+        """
+        self.flush()
+        self.queue.put(None)
+        self.writer.join()
+
+
+def load_dataset(directory):
+    """
+    Load the shards of the complete games of a dataset (of the same map size) as a dict of arrays,
+    adding the outcome of each row (the score of its player in the game).
+    """
+    outcomes = {}
+    complete_games = set()
+    for outcome_path in glob.glob(os.path.join(directory, "game-*.outcome.json")):
+        with open(outcome_path) as outcome_file:
+            outcome = json.load(outcome_file)
+        complete_games.add(outcome["game"])
+        for player_outcome in outcome["players"].values():
+            outcomes[(outcome["game"], player_outcome["player"])] = player_outcome["outcome"]
+
+    shards = []
+    for shard_path in sorted(glob.glob(os.path.join(directory, "game-*.npz"))):
+        with np.load(shard_path) as shard:
+            if int(shard["game"][0]) in complete_games:
+                shards.append(dict(shard))
+
+    if not shards:
+        return {}
+
+    dataset = {name: np.concatenate([shard[name] for shard in shards]) for name in shards[0]}
+    dataset["outcome"] = np.array([
+        outcomes[(game, player)]
+        for game, player in zip(dataset["game"].tolist(), dataset["player"].tolist())
+    ], dtype=np.float32)
+    return dataset
@@ -0,0 +1,197 @@
+import os
+from time import perf_counter
+
+import click
+import numpy as np
+
+from game import ACTIONS_BY_CODE, HARVEST, ToE
+
+AGENT_BOT_TYPE = "agent"
+
+
+class ToEEnv:
+    """
+    Gym style environment over the game, for training bots with reinforcement learning.
+    The agent plays one player, and the opponents are bots run in the same process (no
+    subprocesses, no turn timeouts).
+
+    Observations are a dict with:
+    - "world": a (2, height, width) uint8 array with the structure codes and the owners of every
+      tile (0 is neutral, 1 is the agent, and 2+ the opponents, in the order they were specified).
+    - "resources": the resources of the agent.
+
+    Actions can be (action_type, position) tuples (like the ones bots return), or ints encoding
+    action_code * width * height + tile index (tile index = y * width + x), for a discrete action
+    space of action_count values.
+    """
+    def __init__(self, width=40, height=20, opponents=("passive",), max_turns=1000,
+                 log_path=os.devnull, log_format="none"):
+        if max_turns is not None and max_turns < 2:
+            # games end before turn max_turns, so the agent wouldn't get to play a single turn
+            raise ValueError(f"the games need at least 2 max turns for the agent to play, got {max_turns}")
+
+        self.width = width
+        self.height = height
+        self.opponents = opponents
+        self.max_turns = max_turns
+        self.log_path = log_path
+        self.log_format = log_format
+
+        self.action_count = len(ACTIONS_BY_CODE) * width * height
+        self.toe = None
+        self.agent = None
+        self.game_loop = None
+        self.last_result = None
+
+    def reset(self, seed=None):
+        """
+        Start a new game, and return the first observation of the agent.
+        """
+        if self.toe is not None:
+            self.toe.close_logs()
+        self.toe = ToE(
+            self.width, self.height, log_path=self.log_path, log_format=self.log_format, debug=True,
+            seed=seed,
+        )
+
+        # the agent is always the first player, so its owner id is 1
+        self.toe.add_player(AGENT_BOT_TYPE, AGENT_BOT_TYPE)
+        self.agent = self.toe.players[AGENT_BOT_TYPE]
+        for number, bot_type in enumerate(self.opponents, start=2):
+            self.toe.add_player(f"{bot_type}_{number}", bot_type)
+            self.toe.players[f"{bot_type}_{number}"].start_bot_logic()
+
+        self.last_result = None
+        self.game_loop = self.play_until_agent_turn()
+        next(self.game_loop)
+
+        return self.observation()
+
+    def step(self, action):
+        """
+        Apply the action of the agent and play the opponents until the next turn of the agent.
+        Return (observation, reward, done, info). The reward is 1 if the agent won, -1 if it died,
+        and 0 otherwise.
+        """
+        if isinstance(action, (int, np.integer)):
+            action = self.decode_action(action)
+
+        try:
+            self.game_loop.send(action)
+            done = False
+        except StopIteration:
+            done = True
+
+        reward = 0
+        if done:
+            alive_players = [player for player in self.toe.players.values() if player.alive]
+            if not self.agent.alive:
+                reward = -1
+            elif alive_players == [self.agent]:
+                reward = 1
+
+        action_ok, reason = self.last_result
+        info = {"turn": self.toe.turn_number, "action_ok": action_ok, "reason": reason}
+
+        return self.observation(), reward, done, info
+
+    def close(self):
+        """
+        Close the logs of the current game.
+        """
+        if self.toe is not None:
+            self.toe.close_logs()
+
+    def decode_action(self, action):
+        """
+        Convert an int encoded action into an (action_type, position) action.
+        """
+        action_code, index = divmod(int(action), self.width * self.height)
+        action_type = ACTIONS_BY_CODE[action_code]
+        if action_type == HARVEST:
+            return action_type, None
+        return action_type, self.toe.world.position(index)
+
+    def action_mask(self):
+        """
+        Mask of the int encoded actions that are legal for the agent now (harvest is encoded only
+        once, at tile index 0).
+        """
+        legal_actions = self.toe.legal_actions(self.agent)
+
+        masks = []
+        for action_type in ACTIONS_BY_CODE:
+            if action_type == HARVEST:
+                mask = bytearray(self.width * self.height)
+                mask[0] = legal_actions.harvest
+            else:
+                mask = getattr(legal_actions, action_type)
+            masks.append(mask)
+
+        return np.frombuffer(b"".join(masks), dtype=np.uint8).astype(bool)
+
+    def observation(self):
+        """
+        Current observation of the agent.
+        """
+        world = self.toe.world
+        planes = np.frombuffer(world.structures + world.owners, dtype=np.uint8)
+        return {
+            "world": planes.reshape(2, self.height, self.width),
+            "resources": self.agent.resources,
+        }
+
+    def play_until_agent_turn(self):
+        """
+        Game loop that stops (yields) every time it's the turn of the agent, and receives its
+        action. It ends when the game is over, or the agent died.
+        """
+        toe = self.toe
+        while self.max_turns is None or toe.turn_number < self.max_turns:
+            for player in toe.start_round():
+                if player is self.agent:
+                    action = yield
+                    self.last_result = toe.apply_action(player, action)
+                else:
+                    try:
+                        toe.run_player_turn(player)
+                    except Exception:
+                        # like in subprocesses, a failing bot just loses its turn
+                        continue
+
+            toe.end_round()
+
+            alive_players = [player for player in toe.players.values() if player.alive]
+            if not self.agent.alive or len(alive_players) == 1:
+                break
+
+
+@click.command()
+@click.option("--width", type=int, default=40, help="The width of the map.")
+@click.option("--height", type=int, default=20, help="The height of the map.")
+@click.option("--opponents", type=str, default="passive", help="Comma separated list of the bot types of the opponents.")
+@click.option("--steps", type=int, default=100000, help="Number of steps to play.")
+@click.option("--seed", type=int, default=0, help="Seed of the first game, the next games use the following seeds.")
+def main(width, height, opponents, steps, seed):
+    """
+    Measure the speed of the environment, with an agent that always harvests.
+    """
+    env = ToEEnv(width, height, opponents=opponents.split(","))
+    env.reset(seed=seed)
+    games = 1
+
+    start = perf_counter()
+    for _ in range(steps):
+        _, _, done, _ = env.step((HARVEST, None))
+        if done:
+            env.reset(seed=seed + games)
+            games += 1
+    elapsed = perf_counter() - start
+
+    env.close()
+
+    print(f"{steps} steps in {elapsed:.2f} seconds ({steps / elapsed:.0f} steps/second, {games} games)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import math
+import os
+import sys
+
+import click
+
+from runner import numbered_path, run_games_in_parallel
+
+CANDIDATE = "candidate"
+BASELINE = "baseline"
+
+
+class SPRT:
+    """
+    Sequential probability ratio test over the scores of a candidate bot against a baseline.
+    Each game scores 1 for a candidate win, 0 for a loss, and 0.5 if both survived (draw).
+    It decides between H0 (the candidate's expected score is p0) and H1 (it's p1), with error rates
+    alpha (accepting H1 when H0 is true) and beta (accepting H0 when H1 is true).
+    """
+    def __init__(self, p0, p1, alpha, beta):
+        self.p0 = p0
+        self.p1 = p1
+        self.lower_bound = math.log(beta / (1 - alpha))
+        self.upper_bound = math.log((1 - beta) / alpha)
+
+        self.llr = 0
+        self.games = 0
+        self.score = 0
+        self.squared_score = 0
+
+    def add(self, score):
+        """
+        Add the score of a game.
+        """
+        self.llr += score * math.log(self.p1 / self.p0) + (1 - score) * math.log((1 - self.p1) / (1 - self.p0))
+        self.games += 1
+        self.score += score
+        self.squared_score += score ** 2
+
+    def decision(self):
+        """
+        Return "H1" or "H0" once the test decided, or None if more games are needed.
+        """
+        if self.llr >= self.upper_bound:
+            return "H1"
+        if self.llr <= self.lower_bound:
+            return "H0"
+        return None
+
+    def confidence_interval(self, z=1.96):
+        """
+        Normal approximation interval of the candidate's expected score (95% by default).
+        """
+        mean = self.score / self.games
+        variance = max(self.squared_score / self.games - mean ** 2, 0)
+        margin = z * math.sqrt(variance / self.games)
+        return mean - margin, mean + margin
+
+
+def game_score(winners):
+    """
+    Score of a game from the point of view of the candidate.
+    """
+    if CANDIDATE in winners and BASELINE in winners:
+        return 0.5
+    if CANDIDATE in winners:
+        return 1
+    if BASELINE in winners:
+        return 0
+    return 0.5
+
+
+@click.command()
+@click.option("--candidate", type=str, required=True, help="Bot type of the new version of the bot.")
+@click.option("--baseline", type=str, required=True, help="Bot type to compare against.")
+@click.option("--width", type=int, default=40, help="The width of the map.")
+@click.option("--height", type=int, default=20, help="The height of the map.")
+@click.option("--max-games", type=int, default=1000, help="Maximum number of games to play if the test doesn't decide before.")
+@click.option("--p0", type=float, default=0.5, help="Expected score of the candidate if it's not better than the baseline (H0).")
+@click.option("--p1", type=float, default=0.55, help="Expected score of the candidate if it's better than the baseline (H1).")
+@click.option("--alpha", type=float, default=0.05, help="Probability of accepting H1 when H0 is true.")
+@click.option("--beta", type=float, default=0.05, help="Probability of accepting H0 when H1 is true.")
+@click.option("--seed", type=int, default=0, help="Seed of the first game, the next games use the following seeds.")
+@click.option("--jobs", type=int, default=os.cpu_count(), help="Number of games to play in parallel.")
+@click.option("--turn-timeout", type=float, default=0.5, help="Maximum seconds a player can take to think its turn.")
+@click.option("--max-turns", type=int, default=1000, help="Maximum number of turns of each game.")
+@click.option("--log-path", type=click.Path(), default="./evaluate.log", help="Path for the log files of the games (numbered for each game).")
+def main(candidate, baseline, width, height, max_games, p0, p1, alpha, beta, seed, jobs, turn_timeout, max_turns, log_path):
+    """
+    Compare a candidate bot against a baseline, playing games until a sequential probability
+    ratio test decides if the candidate is better (or the maximum number of games is reached).
+    """
+    if not 0 < p0 < p1 < 1:
+        print("The expected scores must follow 0 < p0 < p1 < 1.")
+        sys.exit(1)
+
+    if max_games < 1:
+        print("At least one game must be played, --max-games must be 1 or more.")
+        sys.exit(1)
+
+    sprt = SPRT(p0, p1, alpha, beta)
+    games = [
+        dict(
+            game_number=game_number,
+            width=width,
+            height=height,
+            seed=seed + game_number,
+            players=[(CANDIDATE, candidate.lower(), None), (BASELINE, baseline.lower(), None)],
+            log_path=numbered_path(log_path, game_number + 1),
+            turn_timeout=turn_timeout,
+            max_turns=max_turns,
+        )
+        for game_number in range(max_games)
+    ]
+
+    print(f"Evaluating {candidate} against {baseline}, H0: score={p0}, H1: score={p1}...")
+    results = run_games_in_parallel(games, jobs)
+    for result in results:
+        sprt.add(game_score(result.winners))
+        low, high = sprt.confidence_interval()
+        print(f"{sprt.games} games, score {sprt.score / sprt.games:.3f} [{low:.3f}, {high:.3f}], LLR {sprt.llr:.2f} ({sprt.lower_bound:.2f}, {sprt.upper_bound:.2f})")
+
+        if sprt.decision():
+            # cancel the games waiting to start, and stop (kill) the ones still running
+            results.close()
+            break
+
+    decision = sprt.decision()
+    if decision == "H1":
+        print(f"{candidate} is better than {baseline} (H1 accepted).")
+    elif decision == "H0":
+        print(f"{candidate} is not better than {baseline} (H0 accepted).")
+    else:
+        print(f"No decision after {sprt.games} games.")
+
+    low, high = sprt.confidence_interval()
+    print(f"Final score of {candidate}: {sprt.score / sprt.games:.3f}, 95% interval [{low:.3f}, {high:.3f}]")
+    print(f"Games played: {sprt.games}, games not played (stopped or never started): {max_games - sprt.games}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import sqlite3
+from datetime import datetime
+
+from game import EVENT_NAMES, Conquered, Built, Eliminated, Failed, Harvested, TurnEnd
+
+DEFAULT_BATCH_SIZE = 500
+
+
+class EventStore:
+    """
+    Local SQLite database with the events of games (actions, their results and costs, and
+    eliminations), indexed by player and turn so they can be queried even while the games are
+    being played.
+    Events are inserted in batches, in a single transaction per batch, at the end of the turns.
+    """
+    def __init__(self, db_path, batch_size=DEFAULT_BATCH_SIZE):
+        # parallel games can write to the same database, WAL lets readers query it meanwhile
+        self.connection = sqlite3.connect(db_path, timeout=60)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS games (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                seed INTEGER,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                players TEXT NOT NULL,
+                started_at TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                game INTEGER NOT NULL REFERENCES games (id),
+                turn INTEGER NOT NULL,
+                player TEXT NOT NULL,
+                bot_type TEXT NOT NULL,
+                event TEXT NOT NULL,
+                action TEXT,
+                x INTEGER,
+                y INTEGER,
+                ok INTEGER NOT NULL,
+                cost INTEGER,
+                resources INTEGER NOT NULL,
+                reason TEXT
+            );
+            CREATE INDEX IF NOT EXISTS events_by_player ON events (player, turn);
+            CREATE INDEX IF NOT EXISTS events_by_turn ON events (game, turn);
+            CREATE INDEX IF NOT EXISTS events_by_bot_type ON events (bot_type, ok);
+        """)
+        self.connection.commit()
+
+        self.batch_size = batch_size
+        self.pending = []
+        self.toe = None
+        self.game_id = None
+
+    def record_game(self, toe):
+        """
+        Register a game and start storing its events.
+        """
+        seed = toe.seed if isinstance(toe.seed, int) else None
+        players = ",".join(str(player) for player in toe.players.values())
+        cursor = self.connection.execute(
+            "INSERT INTO games (seed, width, height, players, started_at) VALUES (?, ?, ?, ?, ?)",
+            (seed, toe.map_size.x, toe.map_size.y, players, datetime.now().isoformat()),
+        )
+        self.connection.commit()
+
+        self.toe = toe
+        self.game_id = cursor.lastrowid
+        toe.subscribe(self.record_event)
+
+    def record_event(self, event):
+        """
+        Queue the row of an event, inserting the pending rows at the end of the turn if there are
+        enough of them.
+        """
+        if isinstance(event, TurnEnd):
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            return
+
+        player = self.toe.players[event.player]
+        action = position = cost = reason = None
+        ok = True
+
+        if isinstance(event, Conquered):
+            action, position, cost = "conquer", event.position, event.cost
+        elif isinstance(event, Built):
+            action, position, cost = event.structure, event.position, event.cost
+        elif isinstance(event, Harvested):
+            action = "harvest"
+        elif isinstance(event, Failed):
+            ok = False
+            reason = str(event.reason)
+            action, position = self.parse_action(event.action)
+        else:
+            assert isinstance(event, Eliminated)
+
+        x, y = position if position is not None else (None, None)
+        self.pending.append((
+            self.game_id, event.turn, player.name, player.bot_type, EVENT_NAMES[type(event)],
+            action, x, y, ok, cost, player.resources, reason,
+        ))
+
+    def parse_action(self, action):
+        """
+        Get the action type and position of a failed action, as far as they make sense.
+        """
+        try:
+            action_type, (x, y) = action
+            return str(action_type), (int(x), int(y))
+        except (TypeError, ValueError):
+            pass
+
+        try:
+            action_type, _ = action
+            return str(action_type), None
+        except (TypeError, ValueError):
+            return None, None
+
+    def flush(self):
+        """
+        Insert the pending rows in a single transaction.
+        """
+        if self.pending:
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT INTO events VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    self.pending,
+                )
+            self.pending = []
+
+    def failure_rates(self):
+        """
+        Get the (bot_type, actions, failed actions) of each bot type, sorted by failure rate.
+        """
+        return self.connection.execute("""
+            SELECT bot_type, COUNT(*) AS actions, COUNT(*) - SUM(ok) AS failed
+            FROM events
+            WHERE event != 'eliminated'
+            GROUP BY bot_type
+            ORDER BY 1.0 * failed / actions DESC
+        """).fetchall()
+
+    def latest_game_id(self):
+        """
+        Get the id of the last game stored, or None if there are no games.
+        """
+        return self.connection.execute("SELECT MAX(id) FROM games").fetchone()[0]
+
+    def resources_over_time(self, game_id, every=1):
+        """
+        Get the (turn, player, resources) at the end of every N turns of a game, for each player.
+        """
+        return self.connection.execute("""
+            SELECT turn, player, resources
+            FROM events
+            WHERE rowid IN (
+                SELECT MAX(rowid) FROM events WHERE game = ? GROUP BY player, turn
+            ) AND turn % ? = 0
+            ORDER BY turn, player
+        """, (game_id, every)).fetchall()
+
+    def close(self):
+        self.flush()
+        self.connection.close()
@@ -1,11 +1,20 @@
 import random
 import importlib
 import sys
+import gzip
 import logging
+import os
+import struct
+import weakref
 from collections import namedtuple
-from datetime import datetime, timedelta
-from multiprocessing import Process, Manager
-from time import sleep
+from collections.abc import ItemsView, Mapping, MutableMapping, Sequence, Set, ValuesView
+from contextlib import contextmanager
+from datetime import timedelta
+from itertools import product, repeat
+from operator import getitem
+from multiprocessing import Process, Pipe
+from multiprocessing.shared_memory import SharedMemory
+from time import monotonic
 
 
 LAND = "land"
@@ -25,6 +34,9 @@ STRUCTURE_COST = {
 }
 
 VALID_ACTIONS = (CONQUER, HARVEST, FARM, FORT, CASTLE)
+# actions stored in compact formats (replays, arrays) use these codes instead of their names
+ACTIONS_BY_CODE = VALID_ACTIONS
+ACTION_CODES = {action_type: code for code, action_type in enumerate(ACTIONS_BY_CODE)}
 STRUCTURES = (FARM, FORT, CASTLE)
 DEFENDER_STRUCTURES = (FORT, CASTLE)
 
@@ -44,8 +56,6 @@ HARVEST_PRODUCTION = {
     CASTLE: 5,
 }
 
-COMMS_IDLE = "idle"
-COMMS_AWAITING_ACTION = "awaiting_action"
 COMMS_ACTION_READY = "action_ready"
 COMMS_ACTION_FAILED = "action_failed"
 
@@ -53,6 +63,954 @@ TILES_PER_CASTLE_LIMIT = 50
 
 Position = namedtuple("Position", "x y")
 Terrain = namedtuple("Terrain", "structure owner")
+SharedWorldRef = namedtuple("SharedWorldRef", "terrains")
+OwnerStats = namedtuple("OwnerStats", "tiles farms forts castles production")
+# harvest is a bool, the rest are masks of the tiles (1 where the action is legal)
+LegalActions = namedtuple("LegalActions", "conquer harvest farm fort castle")
+
+# events of the game, that observers can subscribe to (players are referenced by name)
+Conquered = namedtuple("Conquered", "turn player position structure previous_owner cost")
+Built = namedtuple("Built", "turn player position structure cost")
+Harvested = namedtuple("Harvested", "turn player resources")
+Failed = namedtuple("Failed", "turn player action reason")
+Eliminated = namedtuple("Eliminated", "turn player")
+TurnEnd = namedtuple("TurnEnd", "turn")
+EVENT_TYPES = (Conquered, Built, Harvested, Failed, Eliminated, TurnEnd)
+EVENT_NAMES = {
+    Conquered: "conquered",
+    Built: "built",
+    Harvested: "harvested",
+    Failed: "failed",
+    Eliminated: "eliminated",
+    TurnEnd: "turn_end",
+}
+
+# formats of the log of a game: human readable text, json lines with the events, or no log at all
+LOG_FORMATS = ("text", "jsonl", "none")
+LOG_LINE_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+
+
+# binary format of the game checkpoints
+CHECKPOINT_MAGIC = b"TOEC"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct("<4sBHHIqB")
+CHECKPOINT_PLAYER = struct.Struct("<HHq?")
+CHECKPOINT_RANDOM_STATE = struct.Struct("<625I?d")
+NO_SEED = -1
+
+# structures are stored in the world grid as one byte per tile, using these codes
+STRUCTURES_BY_CODE = (LAND, FARM, FORT, CASTLE)
+STRUCTURE_CODES = {structure: code for code, structure in enumerate(STRUCTURES_BY_CODE)}
+HARVEST_PRODUCTION_BY_CODE = tuple(HARVEST_PRODUCTION[structure] for structure in STRUCTURES_BY_CODE)
+IS_DEFENDER_BY_CODE = tuple(structure in DEFENDER_STRUCTURES for structure in STRUCTURES_BY_CODE)
+# (undefended, defended) conquer costs, by structure code
+CONQUER_COSTS_BY_CODE = tuple(
+    cost if isinstance(cost, tuple) else (cost, cost)
+    for cost in (CONQUER_COSTS[structure] for structure in STRUCTURES_BY_CODE)
+)
+
+# owners are stored in the world grid as one byte per tile, 0 means neutral terrain
+NEUTRAL_ID = 0
+MAX_OWNERS = 255
+
+
+def open_log_file(path):
+    """
+    Open a log file for writing, gzip compressed if the path ends with ".gz".
+    """
+    if path.endswith(".gz"):
+        return gzip.open(path, "wt", compresslevel=6)
+    return open(path, "w")
+
+
+def close_game_logs(logger, log_handler, game_log):
+    """
+    Close the logs of a game: its text log handler (and its file), and its game log.
+    """
+    if log_handler:
+        logger.removeHandler(log_handler)
+        log_handler.close()
+        log_handler.stream.close()
+    if game_log:
+        game_log.close()
+
+
+class BotLogCapture(logging.Handler):
+    """
+    Logging handler that keeps the messages logged by a bot (level and formatted message), so the
+    game can write them to its own log.
+    """
+    def __init__(self, bot_logs):
+        super().__init__()
+        self.bot_logs = bot_logs
+
+    def emit(self, record):
+        self.bot_logs.append((record.levelno, self.format(record)))
+
+
+def capture_bot_logs(bot_logs):
+    """
+    Make the root logger keep the messages logged by a bot in the bot_logs list (bots just use
+    logging.info(), logging.warning(), etc).
+    """
+    root_logger = logging.getLogger()
+    root_logger.handlers = [BotLogCapture(bot_logs)]
+    if root_logger.level != logging.INFO:
+        root_logger.setLevel(logging.INFO)
+
+
+@contextmanager
+def bot_logs_captured(bot_logs):
+    """
+    Capture the messages logged by a bot running in the game process (debug mode) while the
+    context is active, restoring the root logger afterwards.
+    """
+    root_logger = logging.getLogger()
+    handlers, level = root_logger.handlers, root_logger.level
+    capture_bot_logs(bot_logs)
+    try:
+        yield
+    finally:
+        root_logger.handlers = handlers
+        if root_logger.level != level:
+            root_logger.setLevel(level)
+
+
+class ReadOnlySet(Set):
+    """
+    Read only view of a set, so bots can't modify the sets that the game keeps up to date.
+    """
+    def __init__(self, items):
+        self._items = items
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+
+def mask_indexes(mask):
+    """
+    Get the indexes of the non zero bytes of a mask. The bytes are searched in C, so it only takes
+    time proportional to the result (plus a fast scan of the mask).
+    """
+    indexes = []
+    find = mask.find
+    index = find(1)
+    while index != -1:
+        indexes.append(index)
+        index = find(1, index + 1)
+    return indexes
+
+
+class OwnerTileIndex(Sequence):
+    """
+    Sets of tile indexes by owner id and then structure code, built one owner at a time the first
+    time each owner is needed (bots usually only ask for their own tiles, and building the sets of
+    the whole world is slow on big maps).
+    """
+    def __init__(self, structures, owners, owners_count):
+        self.structures = structures
+        self.owners = bytes(owners)
+        self.owner_tiles = [None] * owners_count
+
+    def __getitem__(self, owner_id):
+        structure_tiles = self.owner_tiles[owner_id]
+        if structure_tiles is None:
+            structures = self.structures
+            owner_mask = self.owners.translate(bytes(byte == owner_id for byte in range(256)))
+
+            structure_tiles = [set() for _ in STRUCTURES_BY_CODE]
+            for index in mask_indexes(owner_mask):
+                structure_tiles[structures[index]].add(index)
+            self.owner_tiles[owner_id] = structure_tiles
+
+        return structure_tiles
+
+    def __len__(self):
+        return len(self.owner_tiles)
+
+
+def build_terrains(owner):
+    """
+    Build the terrain values (one per structure code) of an owner.
+    """
+    return [Terrain(structure, owner) for structure in STRUCTURES_BY_CODE]
+
+
+class FlatWorld(Mapping):
+    """
+    Read only Position -> Terrain mapping over flat structure and owner arrays.
+    Structures and owners are kept as one byte per tile, indexed by y * width + x. The terrain
+    values are shared, and looked up by owner id and then structure code.
+    The indexes of tiles (by owner and structure, frontiers, defenses) are built from the arrays
+    the first time they're needed, unless they come from an index source (like the grid of the
+    game, which keeps them up to date, and are only given read only views of).
+    """
+    def __init__(self, width, height, structures, owners, terrains, index_source=None):
+        self.width = width
+        self.height = height
+        self.structures = structures
+        self.owners = owners
+        self.terrains = terrains
+        self.index_source = index_source
+        self._read_only_indexes = {}
+        self.owner_tiles = None
+        self.frontiers = None
+        # masks of the frontier of each owner id (1 where the tile is in it), if they're known
+        self.frontier_masks = None
+        self.defender_counts = None
+        self.conquer_costs = None
+        self._owner_ids_by_name = None
+
+    def index(self, position):
+        """
+        Get the index of a position in the flat arrays. Raise KeyError if it isn't on the map.
+        """
+        try:
+            x, y = position
+            if 0 <= x < self.width and 0 <= y < self.height:
+                index = y * self.width + x
+                if index.__class__ is int:
+                    return index
+                # like in a dict, positions with equal numbers of other types are the same tile
+                if x == int(x) and y == int(y):
+                    return int(index)
+        except (TypeError, ValueError):
+            pass
+
+        raise KeyError(position)
+
+    def position(self, index):
+        """
+        Get the position of an index of the flat arrays.
+        """
+        y, x = divmod(index, self.width)
+        return tuple.__new__(Position, (x, y))
+
+    def adjacent_indexes(self, index):
+        """
+        Return the indexes adjacent to the given index, considering the map size.
+        """
+        x = index % self.width
+        adjacents = []
+        if x > 0:
+            adjacents.append(index - 1)
+        if x < self.width - 1:
+            adjacents.append(index + 1)
+        if index >= self.width:
+            adjacents.append(index - self.width)
+        if index + self.width < len(self.structures):
+            adjacents.append(index + self.width)
+        return adjacents
+
+    def terrain_at(self, index):
+        """
+        Get the terrain at an index of the flat arrays.
+        """
+        return self.terrains[self.owners[index]][self.structures[index]]
+
+    def iter_values(self):
+        """
+        Iterate the terrains of the world in the same order of the original world dict (column by
+        column). The arrays are reordered by column with slices, and the terrains are looked up
+        with map, so the whole loop runs in C.
+        """
+        width = self.width
+        structures_by_column = b"".join(bytes(self.structures[x::width]) for x in range(width))
+        owners_by_column = b"".join(bytes(self.owners[x::width]) for x in range(width))
+        return map(getitem, map(self.terrains.__getitem__, owners_by_column), structures_by_column)
+
+    def iter_positions(self):
+        """
+        Iterate the positions of the world, in the same order of the original world dict (column by
+        column). They're built as they're needed, so big maps don't keep all of them in memory.
+        """
+        return map(tuple.__new__, repeat(Position), product(range(self.width), range(self.height)))
+
+    def iter_items(self):
+        """
+        Iterate the (position, terrain) pairs of the world without validating positions, in the
+        same order of the original world dict (column by column).
+        """
+        return zip(self.iter_positions(), self.iter_values())
+
+    def tile_index(self):
+        """
+        Get the sets of tile indexes by owner id and then structure code (built for each owner the
+        first time it's needed).
+        """
+        if self.index_source is not None:
+            return self.read_only_index("tile_index", lambda owner_tiles: tuple(
+                tuple(ReadOnlySet(tiles) for tiles in structure_tiles)
+                for structure_tiles in owner_tiles
+            ))
+
+        if self.owner_tiles is None:
+            self.owner_tiles = OwnerTileIndex(self.structures, self.owners, len(self.terrains))
+
+        return self.owner_tiles
+
+    def frontier_index(self):
+        """
+        Get the frontier of each owner id: the set of indexes of the tiles that it doesn't own, but
+        are adjacent to tiles that it owns (so it could conquer them). Neutral terrain has no
+        frontier.
+        """
+        if self.index_source is not None:
+            return self.read_only_index("frontier_index", lambda frontiers: tuple(
+                ReadOnlySet(frontier) for frontier in frontiers
+            ))
+
+        if self.frontiers is None and self.frontier_masks is not None:
+            self.frontiers = [set(mask_indexes(mask)) for mask in self.frontier_masks]
+        elif self.frontiers is None:
+            owners = self.owners
+            self.frontiers = [set() for _ in self.terrains]
+            for owner_id, structure_tiles in enumerate(self.tile_index()):
+                if owner_id == NEUTRAL_ID:
+                    continue
+
+                frontier = self.frontiers[owner_id]
+                for tiles in structure_tiles:
+                    for index in tiles:
+                        for adjacent_index in self.adjacent_indexes(index):
+                            if owners[adjacent_index] != owner_id:
+                                frontier.add(adjacent_index)
+
+        return self.frontiers
+
+    def defense_index(self):
+        """
+        Get the defenses of the tiles: the number of adjacent defender structures of the same owner
+        that each tile has, and the cost of conquering each tile (which depends on it).
+        """
+        if self.index_source is not None:
+            return self.read_only_index("defense_index", lambda arrays: tuple(
+                memoryview(array).toreadonly() for array in arrays
+            ))
+
+        if self.defender_counts is None:
+            owners = self.owners
+            defender_counts = bytearray(len(self.structures))
+            for owner_id, structure_tiles in enumerate(self.tile_index()):
+                for structure_code, tiles in enumerate(structure_tiles):
+                    if not IS_DEFENDER_BY_CODE[structure_code]:
+                        continue
+
+                    for index in tiles:
+                        for adjacent_index in self.adjacent_indexes(index):
+                            if owners[adjacent_index] == owner_id:
+                                defender_counts[adjacent_index] += 1
+
+            self.conquer_costs = bytearray(
+                CONQUER_COSTS_BY_CODE[structure_code][defenders > 0]
+                for structure_code, defenders in zip(self.structures, defender_counts)
+            )
+            self.defender_counts = defender_counts
+
+        return self.defender_counts, self.conquer_costs
+
+    def read_only_index(self, name, make_read_only):
+        """
+        Get a read only version of an index of the index source (built once per view, and
+        without copying the index). The index source is asked every time, since it can rebuild its
+        indexes.
+        """
+        index = getattr(self.index_source, name)()
+        cached = self._read_only_indexes.get(name)
+        if cached is None or cached[0] is not index:
+            cached = self._read_only_indexes[name] = (index, make_read_only(index))
+        return cached[1]
+
+    def owner_ids_by_name(self):
+        """
+        Get the owner ids by owner name (as the owners are named in this world).
+        """
+        if self._owner_ids_by_name is None:
+            self._owner_ids_by_name = {
+                terrains[0].owner: owner_id
+                for owner_id, terrains in enumerate(self.terrains)
+            }
+
+        return self._owner_ids_by_name
+
+    def positions_of(self, tile_sets):
+        """
+        Get the positions of the tiles in some sets of tile indexes, in map order (row by row).
+        """
+        indexes = set().union(*tile_sets)
+        return list(map(self.position, sorted(indexes)))
+
+    def tiles_of(self, owner, structure=None):
+        """
+        Get the positions owned by an owner ("mine", None for neutral terrain, or a player name),
+        optionally only the ones with a given structure.
+        It doesn't scan the world, so it only takes time proportional to the result.
+        """
+        owner_id = self.owner_ids_by_name().get(owner)
+        if owner_id is None:
+            return []
+
+        structure_tiles = self.tile_index()[owner_id]
+        if structure is None:
+            return self.positions_of(structure_tiles)
+        else:
+            return self.positions_of([structure_tiles[STRUCTURE_CODES[structure]]])
+
+    def frontier(self, owner=MINE):
+        """
+        Get the positions that an owner could conquer next (not owned by it, but adjacent to its
+        tiles). By default, the frontier of the bot itself.
+        It doesn't scan the world, so it only takes time proportional to the result.
+        """
+        owner_id = self.owner_ids_by_name().get(owner)
+        if owner_id is None:
+            return []
+
+        return self.positions_of([self.frontier_index()[owner_id]])
+
+    def is_defended(self, position):
+        """
+        Check if a position is protected by an adjacent fort or castle of its owner.
+        """
+        defender_counts, _ = self.defense_index()
+        return defender_counts[self.index(position)] > 0
+
+    def conquer_cost(self, position):
+        """
+        Get the cost of conquering a position (considering if it's defended or not).
+        """
+        _, conquer_costs = self.defense_index()
+        return conquer_costs[self.index(position)]
+
+    def conquer_cost_map(self):
+        """
+        Get the conquer costs of all the positions as a read only array of bytes, indexed by
+        y * width + x (like world.index(position) does).
+        """
+        _, conquer_costs = self.defense_index()
+        return memoryview(conquer_costs).toreadonly()
+
+    def legal_actions(self, resources, owner=MINE):
+        """
+        Get the actions that an owner (by default, the bot itself) could do with some resources.
+        For each action type except harvest (which is always legal), the result has a mask of the
+        tiles: bytes indexed by y * width + x (like world.index(position) does), with 1 where the
+        action is legal and 0 where it isn't.
+        They're built from the frontier and tile indexes, without checking the whole world.
+        """
+        size = len(self.structures)
+        no_tiles = bytes(size)
+
+        owner_id = self.owner_ids_by_name().get(owner)
+        if owner_id is None or owner_id == NEUTRAL_ID:
+            return LegalActions(conquer=no_tiles, harvest=True, farm=no_tiles, fort=no_tiles, castle=no_tiles)
+
+        _, conquer_costs = self.defense_index()
+        conquer = bytearray(size)
+        for index in self.frontier_index()[owner_id]:
+            if conquer_costs[index] <= resources:
+                conquer[index] = 1
+
+        structure_tiles = self.tile_index()[owner_id]
+        owned = bytearray(size)
+        for tiles in structure_tiles:
+            for index in tiles:
+                owned[index] = 1
+        owned = bytes(owned)
+
+        owned_tiles = sum(len(tiles) for tiles in structure_tiles)
+        owned_castles = len(structure_tiles[STRUCTURE_CODES[CASTLE]])
+        can_build_castle = not owned_castles or owned_tiles / owned_castles > TILES_PER_CASTLE_LIMIT
+
+        buildable = {
+            structure: owned if resources >= STRUCTURE_COST[structure] else no_tiles
+            for structure in STRUCTURES
+        }
+        if not can_build_castle:
+            buildable[CASTLE] = no_tiles
+
+        return LegalActions(conquer=bytes(conquer), harvest=True, **buildable)
+
+    def tiles_with(self, structure):
+        """
+        Get the positions with a given structure, whoever owns them.
+        """
+        structure_code = STRUCTURE_CODES[structure]
+        return self.positions_of(
+            structure_tiles[structure_code]
+            for structure_tiles in self.tile_index()
+        )
+
+    def enemy_tiles(self, structure=None):
+        """
+        Get the positions owned by other players (not "mine" nor neutral), optionally only the ones
+        with a given structure.
+        """
+        tile_index = self.tile_index()
+        tile_sets = []
+        for owner_id, terrains in enumerate(self.terrains):
+            if terrains[0].owner in (None, MINE):
+                continue
+            if structure is None:
+                tile_sets.extend(tile_index[owner_id])
+            else:
+                tile_sets.append(tile_index[owner_id][STRUCTURE_CODES[structure]])
+
+        return self.positions_of(tile_sets)
+
+    def __getitem__(self, position):
+        try:
+            x, y = position
+            if 0 <= x < self.width and 0 <= y < self.height:
+                index = y * self.width + x
+                if index.__class__ is int:
+                    return self.terrains[self.owners[index]][self.structures[index]]
+        except (TypeError, ValueError):
+            pass
+
+        index = self.index(position)
+        return self.terrains[self.owners[index]][self.structures[index]]
+
+    def __contains__(self, position):
+        try:
+            self.index(position)
+            return True
+        except KeyError:
+            return False
+
+    def __iter__(self):
+        return self.iter_positions()
+
+    def __len__(self):
+        return len(self.structures)
+
+    def items(self):
+        return WorldItemsView(self)
+
+    def values(self):
+        return WorldValuesView(self)
+
+
+class WorldGrid(FlatWorld, MutableMapping):
+    """
+    The world of a game, stored as flat arrays instead of a dict of positions, but still behaving
+    like the dict of Position -> Terrain that bots know.
+    It also keeps counters of tiles, structures and production per owner, updated on every tile
+    change, so the game never needs to scan the whole world to know them.
+    """
+    def __init__(self, width, height):
+        super().__init__(
+            width, height,
+            structures=bytearray(width * height),
+            owners=bytearray(width * height),
+            terrains=[build_terrains(None)],
+        )
+        self.owner_names = [None]
+        self.owner_ids = {None: NEUTRAL_ID}
+
+        # counters indexed by owner id (and then by structure code, for the structure counts)
+        self.tile_counts = [width * height]
+        self.structure_counts = [[width * height] + [0] * (len(STRUCTURES_BY_CODE) - 1)]
+        self.production = [0]
+
+        # ids of the owners that lost their last castle, until someone clears them
+        self.castleless_owner_ids = set()
+
+        # number of adjacent tiles of each owner id that each tile has, to keep the frontiers up to
+        # date (only once the frontiers are built)
+        self.adjacent_counts = None
+
+        # indexes of the changed tiles, in order, if someone enabled it by setting it to a list
+        self.change_log = None
+
+    @classmethod
+    def from_world(cls, width, height, world):
+        """
+        Build a grid with a copy of a world (another grid, a world view, or a plain dict).
+        """
+        grid = cls(width, height)
+        if isinstance(world, FlatWorld):
+            for terrains in world.terrains[1:]:
+                grid.owner_id(terrains[0].owner)
+            grid.restore(world.structures, world.owners)
+        else:
+            for position, terrain in world.items():
+                grid[position] = terrain
+        return grid
+
+    def owner_id(self, owner):
+        """
+        Get the id of an owner, registering it if it's a new one.
+        """
+        if owner not in self.owner_ids:
+            if len(self.owner_names) > MAX_OWNERS:
+                raise ValueError(f"the world can't have more than {MAX_OWNERS} owners")
+
+            self.owner_ids[owner] = len(self.owner_names)
+            self.owner_names.append(owner)
+            self.terrains.append(build_terrains(owner))
+            self.tile_counts.append(0)
+            self.structure_counts.append([0] * len(STRUCTURES_BY_CODE))
+            self.production.append(0)
+            if self.owner_tiles is not None:
+                self.owner_tiles.append([set() for _ in STRUCTURES_BY_CODE])
+            if self.frontiers is not None:
+                self.frontiers.append(set())
+                self.frontier_masks.append(bytearray(len(self.owners)))
+                self.adjacent_counts.append(bytearray(len(self.owners)))
+
+        return self.owner_ids[owner]
+
+    def owner_ids_by_name(self):
+        """
+        Get the owner ids by owner name. The grid keeps them up to date as owners are registered.
+        """
+        return self.owner_ids
+
+    def set_tile(self, index, structure_code, owner_id):
+        """
+        Change the structure and owner of a tile, keeping the owners counters and tile indexes up
+        to date.
+        """
+        old_structure_code = self.structures[index]
+        old_owner_id = self.owners[index]
+
+        if self.owner_tiles is not None:
+            self.owner_tiles[old_owner_id][old_structure_code].discard(index)
+            self.owner_tiles[owner_id][structure_code].add(index)
+
+        self.tile_counts[old_owner_id] -= 1
+        self.structure_counts[old_owner_id][old_structure_code] -= 1
+        self.production[old_owner_id] -= HARVEST_PRODUCTION_BY_CODE[old_structure_code]
+
+        self.tile_counts[owner_id] += 1
+        self.structure_counts[owner_id][structure_code] += 1
+        self.production[owner_id] += HARVEST_PRODUCTION_BY_CODE[structure_code]
+
+        self.structures[index] = structure_code
+        self.owners[index] = owner_id
+
+        if self.change_log is not None:
+            self.change_log.append(index)
+
+        if self.frontiers is not None and owner_id != old_owner_id:
+            self.update_frontiers(index, old_owner_id, owner_id)
+
+        if self.defender_counts is not None:
+            self.update_defenses(index, old_structure_code, old_owner_id, structure_code, owner_id)
+
+        castle_code = STRUCTURE_CODES[CASTLE]
+        if old_structure_code == castle_code and not self.structure_counts[old_owner_id][castle_code]:
+            self.castleless_owner_ids.add(old_owner_id)
+
+    def tile_index(self):
+        """
+        Get the sets of tile indexes by owner id and then structure code, building the sets of all
+        the owners (to keep them up to date) if they weren't built yet.
+        """
+        if self.owner_tiles is None:
+            owner_tiles = [[set() for _ in STRUCTURES_BY_CODE] for _ in self.terrains]
+            for index, (structure_code, owner_id) in enumerate(zip(self.structures, self.owners)):
+                owner_tiles[owner_id][structure_code].add(index)
+            self.owner_tiles = owner_tiles
+
+        return self.owner_tiles
+
+    def frontier_index(self):
+        """
+        Get the frontier of each owner id, building it (and the adjacent counts and masks needed to
+        keep it up to date) if it wasn't built yet.
+        """
+        if self.frontiers is None:
+            self.adjacent_counts = [bytearray(len(self.owners)) for _ in self.owner_names]
+            for owner_id, structure_tiles in enumerate(self.tile_index()):
+                if owner_id == NEUTRAL_ID:
+                    continue
+
+                counts = self.adjacent_counts[owner_id]
+                for tiles in structure_tiles:
+                    for index in tiles:
+                        for adjacent_index in self.adjacent_indexes(index):
+                            counts[adjacent_index] += 1
+
+            super().frontier_index()
+
+            self.frontier_masks = [bytearray(len(self.owners)) for _ in self.owner_names]
+            for frontier, mask in zip(self.frontiers, self.frontier_masks):
+                for index in frontier:
+                    mask[index] = 1
+
+        return self.frontiers
+
+    def frontier_mask_index(self):
+        """
+        Get the masks of the frontier of each owner id (1 where the tile is in its frontier), kept
+        up to date with the frontiers.
+        """
+        self.frontier_index()
+        return self.frontier_masks
+
+    def update_frontiers(self, index, old_owner_id, owner_id):
+        """
+        Update the frontiers of the old and new owners of a tile, only looking at its neighbours.
+        """
+        owners = self.owners
+        adjacent_indexes = self.adjacent_indexes(index)
+
+        if old_owner_id != NEUTRAL_ID:
+            counts = self.adjacent_counts[old_owner_id]
+            frontier = self.frontiers[old_owner_id]
+            mask = self.frontier_masks[old_owner_id]
+            for adjacent_index in adjacent_indexes:
+                counts[adjacent_index] -= 1
+                if not counts[adjacent_index]:
+                    frontier.discard(adjacent_index)
+                    mask[adjacent_index] = 0
+            if counts[index]:
+                frontier.add(index)
+                mask[index] = 1
+
+        if owner_id != NEUTRAL_ID:
+            counts = self.adjacent_counts[owner_id]
+            frontier = self.frontiers[owner_id]
+            mask = self.frontier_masks[owner_id]
+            for adjacent_index in adjacent_indexes:
+                counts[adjacent_index] += 1
+                if owners[adjacent_index] != owner_id:
+                    frontier.add(adjacent_index)
+                    mask[adjacent_index] = 1
+            frontier.discard(index)
+            mask[index] = 0
+
+    def update_defenses(self, index, old_structure_code, old_owner_id, structure_code, owner_id):
+        """
+        Update the defenses of a changed tile and its neighbours, only looking at its neighbours.
+        """
+        structures = self.structures
+        owners = self.owners
+        defender_counts = self.defender_counts
+        conquer_costs = self.conquer_costs
+        adjacent_indexes = self.adjacent_indexes(index)
+
+        was_defender = IS_DEFENDER_BY_CODE[old_structure_code]
+        is_defender = IS_DEFENDER_BY_CODE[structure_code]
+        if was_defender or is_defender:
+            for adjacent_index in adjacent_indexes:
+                adjacent_owner_id = owners[adjacent_index]
+                change = (
+                    (is_defender and adjacent_owner_id == owner_id)
+                    - (was_defender and adjacent_owner_id == old_owner_id)
+                )
+                if change:
+                    defender_counts[adjacent_index] += change
+                    adjacent_costs = CONQUER_COSTS_BY_CODE[structures[adjacent_index]]
+                    conquer_costs[adjacent_index] = adjacent_costs[defender_counts[adjacent_index] > 0]
+
+        if owner_id != old_owner_id:
+            defender_counts[index] = sum(
+                1
+                for adjacent_index in adjacent_indexes
+                if owners[adjacent_index] == owner_id and IS_DEFENDER_BY_CODE[structures[adjacent_index]]
+            )
+
+        conquer_costs[index] = CONQUER_COSTS_BY_CODE[structure_code][defender_counts[index] > 0]
+
+    def restore(self, structures, owners):
+        """
+        Replace the whole content of the world with the given arrays (of a snapshot of a world with
+        the same owners), recomputing the owners counters. The tile indexes are rebuilt the next
+        time they're needed.
+        """
+        self.structures[:] = structures
+        self.owners[:] = owners
+
+        for owner_id in range(len(self.owner_names)):
+            self.tile_counts[owner_id] = 0
+            self.structure_counts[owner_id] = [0] * len(STRUCTURES_BY_CODE)
+            self.production[owner_id] = 0
+
+        for structure_code, owner_id in zip(self.structures, self.owners):
+            self.tile_counts[owner_id] += 1
+            self.structure_counts[owner_id][structure_code] += 1
+            self.production[owner_id] += HARVEST_PRODUCTION_BY_CODE[structure_code]
+
+        self.owner_tiles = None
+        self.frontiers = None
+        self.frontier_masks = None
+        self.adjacent_counts = None
+        self.defender_counts = None
+        self.conquer_costs = None
+
+        if self.change_log is not None:
+            self.change_log.extend(range(len(self.structures)))
+
+        self.castleless_owner_ids.clear()
+
+    def stats(self, owner):
+        """
+        Get the counters of tiles, structures and production of an owner.
+        """
+        owner_id = self.owner_ids[owner]
+        structure_counts = self.structure_counts[owner_id]
+        return OwnerStats(
+            tiles=self.tile_counts[owner_id],
+            farms=structure_counts[STRUCTURE_CODES[FARM]],
+            forts=structure_counts[STRUCTURE_CODES[FORT]],
+            castles=structure_counts[STRUCTURE_CODES[CASTLE]],
+            production=self.production[owner_id],
+        )
+
+    def view_for(self, owner):
+        """
+        Return a read only view of the world as seen by an owner, where its terrain has "mine" as
+        owner. The view shares the arrays and tile indexes of the grid through read only views, so
+        nothing is copied.
+        """
+        terrains = list(self.terrains)
+        terrains[self.owner_ids[owner]] = build_terrains(MINE)
+        return WorldView(
+            self.width, self.height,
+            structures=memoryview(self.structures).toreadonly(),
+            owners=memoryview(self.owners).toreadonly(),
+            terrains=terrains,
+            index_source=self,
+        )
+
+    def __setitem__(self, position, terrain):
+        structure, owner = terrain
+        self.set_tile(self.index(position), STRUCTURE_CODES[structure], self.owner_id(owner))
+
+    def __delitem__(self, position):
+        raise TypeError("tiles can't be removed from the world")
+
+
+class WorldView(FlatWorld):
+    """
+    Read only view of the world handed to a bot, with its own terrain reported as "mine".
+    """
+
+
+class WorldItemsView(ItemsView):
+    """
+    Items view of a world, iterating the flat arrays directly.
+    """
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+class WorldValuesView(ValuesView):
+    """
+    Values view of a world, iterating the flat arrays directly.
+    """
+    def __iter__(self):
+        return self._mapping.iter_values()
+
+
+def pack_text(text):
+    """
+    Pack a short string, prefixed by its length.
+    """
+    raw = text.encode("utf-8")
+    return bytes([len(raw)]) + raw
+
+
+def unpack_text(data, offset):
+    """
+    Unpack a string packed with pack_text, returning it with the offset after it.
+    """
+    length = data[offset]
+    start = offset + 1
+    return bytes(data[start:start + length]).decode("utf-8"), start + length
+
+
+class SharedWorld:
+    """
+    A shared memory block where the game publishes the world for all the bot subprocesses, once
+    each time it changes. Only the structure and owner arrays (and the defenses and frontier masks
+    the game keeps up to date) are copied, and each bot gets a small reference with its own terrain
+    table instead of a pickled world.
+    The arrays are preceded by a counter of writes, odd while a write is in progress, so bots never
+    load a half written world.
+    """
+    HEADER = struct.Struct("<Q")
+    # structures, owners, defender counts and conquer costs, followed by a frontier mask per owner
+    ARRAYS = 4
+
+    def __init__(self, width, height, owners_count):
+        self.width = width
+        self.height = height
+        self.size = width * height
+        self.arrays_count = self.ARRAYS + owners_count
+        self.memory = SharedMemory(create=True, size=self.HEADER.size + self.size * self.arrays_count)
+        self.writes = 0
+        self.version = None
+
+    def publish(self, world, version):
+        """
+        Copy the arrays of the world into the shared memory, unless that version of the world (any
+        number that changes when the world changes) is the one already published.
+        """
+        if version == self.version:
+            return
+
+        defender_counts, conquer_costs = world.defense_index()
+        frontier_masks = world.frontier_mask_index()
+        buf = self.memory.buf
+        self.writes += 1
+        self.HEADER.pack_into(buf, 0, self.writes)
+        offset = self.HEADER.size
+        for array in (world.structures, world.owners, defender_counts, conquer_costs, *frontier_masks):
+            buf[offset:offset + self.size] = array
+            offset += self.size
+        self.writes += 1
+        self.HEADER.pack_into(buf, 0, self.writes)
+        self.version = version
+
+    def reference(self, world):
+        """
+        Return the reference that a bot subprocess can use to load the published world, as seen in
+        a view of it.
+        """
+        return SharedWorldRef(world.terrains)
+
+    def load(self, world_ref):
+        """
+        Build the world view of a turn from the published arrays. The arrays are copied right away
+        (a cheap memory copy) so later turns can't change them while the bot thinks.
+        """
+        buf = self.memory.buf
+        while True:
+            writes, = self.HEADER.unpack_from(buf, 0)
+            if writes % 2:
+                # the game is writing the next version
+                continue
+
+            offset = self.HEADER.size
+            structures, owners, defender_counts, conquer_costs, *frontier_masks = (
+                bytes(buf[offset + self.size * number:offset + self.size * (number + 1)])
+                for number in range(self.arrays_count)
+            )
+            if self.HEADER.unpack_from(buf, 0) == (writes,):
+                break
+
+        world = WorldView(self.width, self.height, structures, owners, world_ref.terrains)
+        world.defender_counts = defender_counts
+        world.conquer_costs = conquer_costs
+        world.frontier_masks = frontier_masks
+        return world
+
+    def close(self):
+        """
+        Release the shared memory block.
+        """
+        self.memory.close()
+        self.memory.unlink()
 
 
 class Player:
@@ -68,24 +1026,41 @@ class Player:
         self.alive = True
         self.debug_bot_logic = None
 
-        self.comms = None
+        self.connection = None
         self.process = None
+        self.last_request_id = 0
+        # a request that the bot didn't answer yet (it timed out, and may still be thinking)
+        self.pending_request = False
+        self.shared_world = None
+        # messages logged by the bot, that the game didn't write to its log yet
+        self.bot_logs = []
+
+        # position in the change log of the world at the last turn of the player (None if it
+        # hasn't played yet)
+        self.change_log_position = None
 
     def __str__(self):
         return f"{self.name}:{self.bot_type}"
 
-    def start_bot_logic(self):
+    def start_bot_logic(self, shared_world=None):
         """
         Launch the bot logic subprocess, unless the game is in debug mode, in that case just
         instantiate the bot.
+        If a shared world is specified, the subprocess gets the world of each turn through it.
         """
         if self.debug:
-            self.debug_bot_logic = import_bot_logic(self.bot_type)
+            with bot_logs_captured(self.bot_logs):
+                self.debug_bot_logic = import_bot_logic(self.bot_type)
         else:
-            self.comms = Manager().dict()
-            self.comms["status"] = COMMS_IDLE
-            self.process = Process(target=bot_logic_subprocess_loop, args=(self.bot_type, self.comms))
+            self.shared_world = shared_world
+
+            self.connection, bot_connection = Pipe()
+            self.process = Process(
+                target=bot_logic_subprocess_loop,
+                args=(self.bot_type, bot_connection, self.shared_world),
+            )
             self.process.start()
+            bot_connection.close()
 
     def stop_bot_logic(self):
         """
@@ -93,45 +1068,118 @@ class Player:
         """
         if not self.debug and self.process:
             self.process.kill()
+            self.connection.close()
+
+    def finish_pending_request(self, timeout):
+        """
+        Wait up to timeout seconds for the bot to answer a request that it didn't answer in time
+        (the late answer is ignored), and return True if the bot is ready for a new request.
+        New requests aren't sent while the bot is still thinking, or a bot stuck in a turn would
+        fill the pipe and block the game.
+        """
+        if self.debug or not self.pending_request:
+            return True
 
-    def ask_action(self, map_size, world, timeout):
+        try:
+            deadline = None if timeout is None else monotonic() + timeout.total_seconds()
+            while True:
+                remaining = None if deadline is None else max(deadline - monotonic(), 0)
+                if not self.connection.poll(remaining):
+                    return False
+
+                request_id, _, _, bot_logs = self.connection.recv()
+                self.bot_logs.extend(bot_logs)
+                if request_id == self.last_request_id:
+                    self.pending_request = False
+                    return True
+        except (EOFError, OSError):
+            # the bot process died, asking it for an action will tell
+            self.pending_request = False
+            return True
+
+    def ask_action(self, map_size, world, timeout, turn_delta=None):
         """
         Ask the bot logic for an action, waiting up to timeout seconds.
+        If the turn delta (changes, turn_number) is specified, bots with a turn_delta() method get
+        it before their turn.
         """
         if self.debug:
-            action = self.debug_bot_logic.turn(map_size, self.resources, world)
+            with bot_logs_captured(self.bot_logs):
+                if turn_delta is not None and hasattr(self.debug_bot_logic, "turn_delta"):
+                    self.debug_bot_logic.turn_delta(*turn_delta)
+                action = self.debug_bot_logic.turn(map_size, self.resources, world)
             return True, action
         else:
-            self.comms["action_params"] = (map_size, self.resources, world)
-            self.comms["status"] = COMMS_AWAITING_ACTION
+            if not self.process.is_alive():
+                # a dead bot (crashed, killed, failed to import) just loses all its turns
+                return False, "bot process died"
+
+            if self.shared_world and isinstance(world, FlatWorld):
+                # the game published the world in shared memory, just send the terrains of the view
+                world = self.shared_world.reference(world)
+            elif isinstance(world, FlatWorld):
+                # read only views of the grid can't be pickled, send a snapshot of the arrays
+                world = WorldView(
+                    world.width, world.height, bytes(world.structures), bytes(world.owners), world.terrains,
+                )
 
-            start_time = datetime.now()
-            while datetime.now() - start_time < timeout:
-                if self.comms["status"] == COMMS_ACTION_READY:
-                    return True, self.comms["action"]
-                elif self.comms["status"] == COMMS_ACTION_FAILED:
-                    return False, self.comms["error"]
+            try:
+                # requests are numbered, so late answers to previous requests can be ignored
+                self.last_request_id += 1
+                self.connection.send((self.last_request_id, (map_size, self.resources, world, turn_delta)))
+                self.pending_request = True
+
+                deadline = None if timeout is None else monotonic() + timeout.total_seconds()
+                while True:
+                    remaining = None if deadline is None else max(deadline - monotonic(), 0)
+                    if not self.connection.poll(remaining):
+                        break
+
+                    request_id, status, result, bot_logs = self.connection.recv()
+                    self.bot_logs.extend(bot_logs)
+                    if request_id == self.last_request_id:
+                        self.pending_request = False
+                        return status == COMMS_ACTION_READY, result
+            except (EOFError, OSError):
+                # the bot process died while we were talking to it
+                return False, "bot process died"
 
             return False, f"timeout, did not return an action in {timeout.total_seconds()} seconds"
 
 
-def bot_logic_subprocess_loop(bot_type, comms):
+def bot_logic_subprocess_loop(bot_type, connection, shared_world=None):
     """
-    The loop that runs the bot logic in a subprocess, communicating via comms.
+    The loop that runs the bot logic in a subprocess, communicating via a pipe connection (and
+    receiving the world via shared memory, if available).
+    It blocks while waiting for requests, so idle bots don't use any cpu.
+    The messages that the bot logs are sent to the game with its answers, so the game writes them
+    to its own log.
     """
+    # forked subprocesses inherit the logging config of the game process, the bot gets its own
+    bot_logs = []
+    capture_bot_logs(bot_logs)
+
     bot_logic = import_bot_logic(bot_type)
 
     while True:
-        if comms["status"] == COMMS_AWAITING_ACTION:
-            map_size, player_resources, world = comms["action_params"]
-            try:
-                action = bot_logic.turn(map_size, player_resources, world)
+        try:
+            request_id, (map_size, player_resources, world, turn_delta) = connection.recv()
+        except EOFError:
+            # the game closed its end of the pipe
+            break
+
+        try:
+            if isinstance(world, SharedWorldRef):
+                world = shared_world.load(world)
 
-                comms["action"] = action
-                comms["status"] = COMMS_ACTION_READY
-            except Exception as err:
-                comms["error"] = repr(err)
-                comms["status"] = COMMS_ACTION_FAILED
+            if turn_delta is not None and hasattr(bot_logic, "turn_delta"):
+                bot_logic.turn_delta(*turn_delta)
+
+            action = bot_logic.turn(map_size, player_resources, world)
+            connection.send((request_id, COMMS_ACTION_READY, action, bot_logs))
+        except Exception as err:
+            connection.send((request_id, COMMS_ACTION_FAILED, repr(err), bot_logs))
+        bot_logs.clear()
 
 
 def import_bot_logic(bot_type):
@@ -159,33 +1207,225 @@ def import_bot_logic(bot_type):
         return bot_class()
 
 
-class ToE:
+def plain_action(action):
+    """
+    Copy an action returned by a bot into plain tuples (the action, and its position). Lists and
+    tuples are read with the methods of their base types, so subclasses can't run code in the game
+    or look different each time they're read. Anything else is returned as it is, for the rules to
+    reject it.
+    """
+    for base_type in (tuple, list):
+        if isinstance(action, base_type):
+            items = tuple(base_type.__getitem__(action, i) for i in range(base_type.__len__(action)))
+            if len(items) == 2:
+                action_type, position = items
+                return action_type, plain_action(position)
+            return items
+
+    return action
+
+
+class GameRules:
+    """
+    The rules of the game: the effects of the actions of the players on the world.
+    Subclasses must have a world (a WorldGrid) and players (with name and resources).
+    """
+    def apply_action(self, player, action):
+        """
+        Validate and apply the action of a player.
+        """
+        if not isinstance(action, (list, tuple)) or not len(action) == 2:
+            return False, f"{action} does not follow the action format, (action_type, position)"
+
+        action_type, action_position = action
+
+        if action_type not in VALID_ACTIONS:
+            return False, f"unknown action type {action_type}"
+
+        if action_type == CONQUER:
+            return self.conquer(player, action_position)
+        elif action_type == HARVEST:
+            return self.harvest(player)
+        else:
+            assert action_type in STRUCTURES
+            return self.build(player, action_type, action_position)
+
+    def harvest(self, player):
+        """
+        Produce resources with the player's structures.
+        """
+        produced_resources = self.world.production[self.world.owner_ids[player.name]]
+
+        player.resources += produced_resources
+
+        return True, f"harvest produced {produced_resources} resources"
+
+    def conquer(self, player, position):
+        """
+        Conquer a position on the map, if possible. Return True if the action was successful.
+        """
+        try:
+            index = self.world.index(position)
+        except KeyError:
+            return False, f"can't conquer a position that isn't on the map {position}"
+
+        player_id = self.world.owner_ids[player.name]
+        structures = self.world.structures
+        owners = self.world.owners
+
+        target_owner_id = owners[index]
+        if target_owner_id == player_id:
+            return False, "can't conquer terrain that is already yours"
+
+        in_range = any(
+            owners[adjacent_index] == player_id
+            for adjacent_index in self.world.adjacent_indexes(index)
+        )
+        if not in_range:
+            return False, "can't conquer terrain that isn't adjacent to your empire"
+
+        target_structure = STRUCTURES_BY_CODE[structures[index]]
+        defender_counts, conquer_costs = self.world.defense_index()
+        cost = conquer_costs[index]
+        thing_conquered = target_structure
+
+        if isinstance(CONQUER_COSTS[target_structure], tuple):
+            if defender_counts[index]:
+                thing_conquered = f"defended {thing_conquered}"
+            else:
+                thing_conquered = f"unprotected {thing_conquered}"
+
+        if player.resources < cost:
+            return False, f"not enough resources to conquer {thing_conquered}, costs {cost}"
+
+        self.world.set_tile(index, STRUCTURE_CODES[LAND], player_id)
+        player.resources -= cost
+
+        enemy = self.world.owner_names[target_owner_id]
+        if enemy is None:
+            enemy = "neutral"
+
+        return True, f"conquered {thing_conquered} from {enemy} spending {cost} resources"
+
+    def build(self, player, structure, position):
+        """
+        Fortify a position on the map, if possible. Return True if the action was successful.
+        """
+        cost = STRUCTURE_COST[structure]
+
+        if player.resources < cost:
+            return False, f"not enough resources to build {structure}, costs {cost}"
+
+        try:
+            index = self.world.index(position)
+        except KeyError:
+            return False, f"can't conquer a position that isn't on the map {position}"
+
+        player_id = self.world.owner_ids[player.name]
+        if self.world.owners[index] != player_id:
+            return False, "can't build structures on terrain that you don't own"
+
+        if structure == CASTLE:
+            owned_castles = self.world.structure_counts[player_id][STRUCTURE_CODES[CASTLE]]
+            owned_tiles = self.world.tile_counts[player_id]
+
+            if owned_castles and owned_tiles / owned_castles <= TILES_PER_CASTLE_LIMIT:
+                return False, f"can't build more castles, you need more tiles (you have {owned_castles} castles and {owned_tiles} tiles)"
+
+        self.world.set_tile(index, STRUCTURE_CODES[structure], player_id)
+        player.resources -= cost
+        return True, f"built {structure} spending {cost} resources"
+
+    def legal_actions(self, player):
+        """
+        Get the actions that a player could do now, as masks of the tiles.
+        """
+        return self.world.legal_actions(player.resources, player.name)
+
+    def adjacent_positions(self, position):
+        """
+        Return the valid positions adjacent to the given position, considering the map size.
+        """
+        return [
+            self.world.position(adjacent_index)
+            for adjacent_index in self.world.adjacent_indexes(self.world.index(position))
+        ]
+
+
+class ToE(GameRules):
     """
     A game of Terrain of Empires.
     """
-    def __init__(self, width, height, ui=None, log_path=None, turn_timeout=0.5, debug=False):
+    def __init__(self, width, height, ui=None, log_path=None, turn_timeout=0.5, debug=False,
+                 safe_world_copies=False, seed=None, replay_path=None, checkpoint_path=None,
+                 checkpoint_every=None, recorder=None, log_format="text"):
         self.map_size = Position(width, height)
         self.ui = ui
         self.turn_timeout = timedelta(seconds=turn_timeout)
         self.debug = debug
+        self.safe_world_copies = safe_world_copies
 
+        # the random choices of the game (castle placement and turn order) are reproducible if a
+        # seed is specified
+        self.seed = seed
+        self.random = random.Random(seed)
 
+        self.replay_path = replay_path
+        self.replay = None
+        self.initial_castles = {}
+
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_every = checkpoint_every
+
+        # shared memory where the world is published for the bot subprocesses
+        self.shared_world = None
+
+        # optional recorder of the turns of the players (like a dataset.DatasetRecorder)
+        self.recorder = recorder
+
+        # callbacks subscribed to each type of event
+        self.observers = {}
+
+        self.turn_number = 1
         self.players = {}
         self.players_comms = {}
-        self.world = {
-            Position(x, y): Terrain(LAND, None)
-            for x in range(self.map_size.x)
-            for y in range(self.map_size.y)
-        }
+        self.world = WorldGrid(width, height)
+
+        # the changes of the world are logged, to tell the bots what changed since their last turn.
+        # The log is trimmed once every player saw its start, so positions are offset
+        self.world.change_log = []
+        self.change_log_offset = 0
 
         if log_path is None:
             log_path = "./toe.log"
 
-        logging.basicConfig(
-            filename=log_path, level=logging.INFO, filemode="w",
-            format="%(asctime)s %(levelname)s %(message)s",
+        # each game has its own logger, that isn't registered in the logging module, so games
+        # running at the same time (or one after the other) don't share handlers
+        self.logger = logging.Logger("toe")
+        self.log_handler = None
+        self.game_log = None
+        if log_format == "text":
+            self.log_handler = logging.StreamHandler(open_log_file(log_path))
+            self.log_handler.setFormatter(logging.Formatter(LOG_LINE_FORMAT))
+            self.logger.addHandler(self.log_handler)
+            self.logger.setLevel(logging.INFO)
+        else:
+            # without the text log, its messages aren't even formatted (nor printed to stderr)
+            self.logger.addHandler(logging.NullHandler())
+            self.logger.setLevel(logging.WARNING)
+
+            if log_format == "jsonl":
+                from game_log import JsonlGameLog  # prevent circular import
+                self.game_log = JsonlGameLog(log_path)
+                self.subscribe(self.game_log.log_event)
+
+        # games that never play (like the ones rebuilt from replays) close their logs when they
+        # are discarded
+        self.logs_finalizer = weakref.finalize(
+            self, close_game_logs, self.logger, self.log_handler, self.game_log,
         )
-        logging.info("game created with size %s x %s", width, height)
+
+        self.logger.info("game created with size %s x %s", width, height)
 
     def add_player(self, name, bot_type, castle_position=None):
         """
@@ -195,8 +1435,8 @@ class ToE:
             # keep trying until we find an empty spot for the new player
             while True:
                 castle_position = Position(
-                    random.randint(0, self.map_size.x - 1),
-                    random.randint(0, self.map_size.y - 1),
+                    self.random.randint(0, self.map_size.x - 1),
+                    self.random.randint(0, self.map_size.y - 1),
                 )
                 if self.world[castle_position].structure == LAND:
                     break
@@ -204,12 +1444,15 @@ class ToE:
         player = Player(name, bot_type, resources=0, debug=self.debug)
 
         self.players[name] = player
-        self.world[castle_position] = Terrain(CASTLE, name)
+        self.initial_castles[name] = Position(*castle_position)
+        self.world.set_tile(
+            self.world.index(castle_position), STRUCTURE_CODES[CASTLE], self.world.owner_id(name),
+        )
 
         if self.ui:
             self.ui.add_player(player)
 
-        logging.info("player %s added with initial castle at %s", player, castle_position)
+        self.logger.info("player %s added with initial castle at %s", player, castle_position)
 
     def play(self, max_turns=None):
         """
@@ -218,54 +1461,162 @@ class ToE:
         Return the winner and the number of turns played.
         """
         try:
-            logging.info("starting game loop")
+            self.logger.info("starting game loop")
             winners = None
 
-            logging.info("starting the subprocesses for the player bots logic")
-            for player in self.players.values():
-                player.start_bot_logic()
-
-            turn_number = 1
-            while max_turns is None or turn_number < max_turns:
-                players = list(self.players.values())
-                random.shuffle(players)
-                logging.info("turn %s order: %s", turn_number, ",".join(p.name for p in players))
+            if self.replay_path:
+                from replay import ReplayWriter  # prevent circular import
+                self.replay = ReplayWriter(self.replay_path, self)
 
-                for player in players:
-                    if not player.alive:
-                        # dead players don't play anymore
-                        continue
+            self.logger.info("starting the subprocesses for the player bots logic")
+            if not self.debug:
+                self.shared_world = SharedWorld(*self.map_size, len(self.world.owner_names))
+            for player in self.players.values():
+                player.start_bot_logic(self.shared_world)
 
+            while max_turns is None or self.turn_number < max_turns:
+                for player in self.start_round():
                     turn_ok, reason = self.run_player_turn(player)
                     if turn_ok:
-                        logging.info("%s action ran ok: %s", player, reason)
+                        self.logger.info("%s action ran ok: %s", player, reason)
                     else:
-                        logging.info("%s action failed: %s", player, reason)
+                        self.logger.info("%s action failed: %s", player, reason)
 
                 if self.ui:
-                    self.ui.render(self, turn_number)
+                    self.ui.render(self, self.turn_number)
 
-                self.update_alive_players()
-                turn_number += 1
+                self.end_round()
 
                 if len([player for player in self.players.values() if player.alive]) == 1:
                     break
 
             winners = [player for player in self.players.values() if player.alive]
             if winners:
-                logging.info("%s won!", " and ".join(winner.name for winner in winners))
+                self.logger.info("%s won!", " and ".join(winner.name for winner in winners))
+
+            if self.recorder:
+                self.recorder.record_outcome(self, winners)
 
             try:
                 if self.ui:
-                    self.ui.render(self, turn_number, winners)
+                    self.ui.render(self, self.turn_number, winners)
             except KeyboardInterrupt:
                 pass
         except KeyboardInterrupt:
             raise
         finally:
             self.stop_players_bots()
+            if self.replay:
+                self.replay.close()
+            self.close_logs()
+
+        return winners, self.turn_number
+
+    def start_round(self):
+        """
+        Start a round of turns, yielding the players in the (random) order they play. Players that
+        are dead (even if they died during the round) are skipped.
+        """
+        players = list(self.players.values())
+        self.random.shuffle(players)
+        self.logger.info("turn %s order: %s", self.turn_number, ",".join(p.name for p in players))
+
+        for player in players:
+            if player.alive:
+                yield player
+
+    def end_round(self):
+        """
+        Finish a round of turns: update the alive players, tell the observers, forget the changes
+        all the players saw, and save a checkpoint if it's time for one.
+        """
+        self.update_alive_players()
+        if self.observers:
+            self.emit(TurnEnd(self.turn_number))
+        self.trim_change_log()
+        self.turn_number += 1
+
+        if self.checkpoint_every and (self.turn_number - 1) % self.checkpoint_every == 0:
+            self.save_checkpoint(self.checkpoint_path)
+
+    def close_logs(self):
+        """
+        Close the logs of the game.
+        """
+        self.logs_finalizer()
+        self.log_handler = None
+        self.game_log = None
+
+    def save_checkpoint(self, path):
+        """
+        Save a compact binary snapshot of the game (world, players, turn number and random state),
+        that can be resumed later with load_checkpoint.
+        The file is replaced atomically, so a crash while saving doesn't break the last checkpoint.
+        """
+        seed = self.seed if isinstance(self.seed, int) else NO_SEED
+        random_version, random_internal_state, gauss_next = self.random.getstate()
+
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "wb") as checkpoint_file:
+            checkpoint_file.write(CHECKPOINT_HEADER.pack(
+                CHECKPOINT_MAGIC, CHECKPOINT_VERSION, self.map_size.x, self.map_size.y,
+                self.turn_number, seed, len(self.players),
+            ))
+            for name, player in self.players.items():
+                checkpoint_file.write(pack_text(name))
+                checkpoint_file.write(pack_text(player.bot_type))
+                checkpoint_file.write(CHECKPOINT_PLAYER.pack(
+                    *self.initial_castles[name], player.resources, player.alive,
+                ))
+            checkpoint_file.write(CHECKPOINT_RANDOM_STATE.pack(
+                *random_internal_state, gauss_next is not None, gauss_next or 0,
+            ))
+            checkpoint_file.write(self.world.structures)
+            checkpoint_file.write(self.world.owners)
+
+        os.replace(temp_path, path)
+        self.logger.info("checkpoint saved to %s before turn %s", path, self.turn_number)
+
+    @classmethod
+    def load_checkpoint(cls, path, **toe_kwargs):
+        """
+        Create a game from a checkpoint saved with save_checkpoint, ready to continue playing.
+        """
+        with open(path, "rb") as checkpoint_file:
+            data = checkpoint_file.read()
+
+        (magic, version, width, height, turn_number, seed,
+         players_count) = CHECKPOINT_HEADER.unpack_from(data)
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise ValueError(f"{path} isn't a checkpoint file of a supported version")
+
+        toe = cls(width, height, seed=None if seed == NO_SEED else seed, **toe_kwargs)
+        toe.turn_number = turn_number
+
+        offset = CHECKPOINT_HEADER.size
+        players_state = []
+        for _ in range(players_count):
+            name, offset = unpack_text(data, offset)
+            bot_type, offset = unpack_text(data, offset)
+            x, y, resources, alive = CHECKPOINT_PLAYER.unpack_from(data, offset)
+            offset += CHECKPOINT_PLAYER.size
+
+            toe.add_player(name, bot_type, castle_position=Position(x, y))
+            players_state.append((toe.players[name], resources, alive))
+
+        for player, resources, alive in players_state:
+            player.resources = resources
+            player.alive = alive
 
-        return winners, turn_number
+        *random_internal_state, has_gauss_next, gauss_next = CHECKPOINT_RANDOM_STATE.unpack_from(data, offset)
+        offset += CHECKPOINT_RANDOM_STATE.size
+        toe.random.setstate((3, tuple(random_internal_state), gauss_next if has_gauss_next else None))
+
+        size = width * height
+        toe.world.restore(data[offset:offset + size], data[offset + size:offset + size * 2])
+
+        toe.logger.info("game restored from checkpoint %s before turn %s", path, turn_number)
+        return toe
 
     def stop_players_bots(self):
         """
@@ -274,182 +1625,178 @@ class ToE:
         for player in self.players.values():
             player.stop_bot_logic()
 
+        if self.shared_world:
+            self.shared_world.close()
+            self.shared_world = None
+
+    def log_bot_messages(self, player):
+        """
+        Write the messages that the bot of a player logged to the log of the game.
+        """
+        if player.bot_logs:
+            for level, message in player.bot_logs:
+                self.logger.log(level, "%s bot logged: %s", player, message)
+            player.bot_logs.clear()
+
     def run_player_turn(self, player):
         """
         A player takes its turn to play.
         """
-        player_world = self.copy_world_for_player(player)
+        finished = player.finish_pending_request(self.turn_timeout)
+        self.log_bot_messages(player)
+        if not finished:
+            # the turn is lost, and its changes are kept for the next turn the bot plays
+            reason = "timeout, still thinking a previous turn"
+            if self.observers:
+                self.emit(Failed(self.turn_number, player.name, None, reason))
+            return False, reason
+
+        if self.safe_world_copies:
+            player_world = self.copy_world_for_player(player)
+        else:
+            player_world = self.world.view_for(player.name)
+            if self.shared_world:
+                # the world is published once for all the bots, each time it changes
+                self.shared_world.publish(self.world, self.change_log_offset + len(self.world.change_log))
 
-        logging.info("%s calling turn() function with %s resources", player, player.resources)
+        self.logger.info("%s calling turn() function with %s resources", player, player.resources)
         got_action, action = player.ask_action(
             self.map_size,
             player_world,
             timeout=self.turn_timeout,
+            turn_delta=(self.changes_since_last_turn(player, player_world), self.turn_number),
         )
+        self.log_bot_messages(player)
 
         if got_action:
-            logging.info("%s requested action: %s", player, action)
+            # the rules, the recorder and the observers all get the same copy of the action
+            action = plain_action(action)
+            self.logger.info("%s requested action: %s", player, action)
         else:
+            if self.observers:
+                self.emit(Failed(self.turn_number, player.name, None, action))
             return False, action
 
-        if not isinstance(action, (list, tuple)) or not len(action) == 2:
-            return False, f"{action} does not follow the action format, (action_type, position)"
-
-        action_type, action_position = action
-
-        if action_type not in VALID_ACTIONS:
-            return False, f"unknown action type {action_type}"
-
-        if action_type == CONQUER:
-            return self.conquer(player, action_position)
-        elif action_type == HARVEST:
-            return self.harvest(player)
-        else:
-            assert action_type in STRUCTURES
-            return self.build(player, action_type, action_position)
+        if self.recorder:
+            self.recorder.record_turn(self, player, action)
 
-    def copy_world_for_player(self, player):
-        """
-        Return a copy of the world to pass to the player (for safety), also modifying the world so
-        their terrain positions have "mine" as owner.
-        """
-        return {
-            position: Terrain(
-                terrain.structure,
-                terrain.owner if terrain.owner != player.name else MINE,
-            )
-            for position, terrain in self.world.items()
-        }
+        return self.apply_action(player, action)
 
-    def harvest(self, player):
+    def changes_since_last_turn(self, player, player_world):
         """
-        Produce resources with the player's structures.
+        Get the (position, terrain) pairs of the tiles that changed since the last turn of a player,
+        as seen in its world. None if the player didn't play yet, so it must look at the whole
+        world.
         """
-        produced_resources = 0
+        change_log = self.world.change_log
+        last_position = player.change_log_position
+        player.change_log_position = self.change_log_offset + len(change_log)
 
-        for terrain in self.world.values():
-            if terrain.owner == player.name:
-                produced_resources += HARVEST_PRODUCTION[terrain.structure]
+        if last_position is None:
+            return None
 
-        player.resources += produced_resources
-
-        return True, f"harvest produced {produced_resources} resources"
+        changed_indexes = sorted(set(change_log[last_position - self.change_log_offset:]))
+        return [
+            (position, player_world[position])
+            for position in map(self.world.position, changed_indexes)
+        ]
 
-    def conquer(self, player, position):
+    def trim_change_log(self):
         """
-        Conquer a position on the map, if possible. Return True if the action was successful.
+        Forget the changes that all the alive players already got.
         """
-        if position not in self.world:
-            return False, f"can't conquer a position that isn't on the map {position}"
-
-        target = self.world[position]
-        if target.owner == player.name:
-            return False, "can't conquer terrain that is already yours"
-
-        adjacents = [
-            self.world[adjacent_position]
-            for adjacent_position in self.adjacent_positions(position)
-        ]
-
-        in_range = any(
-            adjacent.owner == player.name
-            for adjacent in adjacents
+        change_log = self.world.change_log
+        end = self.change_log_offset + len(change_log)
+        start = min(
+            (
+                player.change_log_position
+                for player in self.players.values()
+                if player.alive and player.change_log_position is not None
+            ),
+            default=end,
         )
-        if not in_range:
-            return False, "can't conquer terrain that isn't adjacent to your empire"
-
-        cost = CONQUER_COSTS[target.structure]
-        thing_conquered = target.structure
-
-        if isinstance(cost, tuple):
-            undefended_cost, defended_cost = cost
-
-            is_defended = any(
-                adjacent.structure in DEFENDER_STRUCTURES and adjacent.owner == target.owner
-                for adjacent in adjacents
-            )
-            if is_defended:
-                cost = defended_cost
-                thing_conquered = f"defended {thing_conquered}"
-            else:
-                cost = undefended_cost
-                thing_conquered = f"unprotected {thing_conquered}"
-
-        if player.resources < cost:
-            return False, f"not enough resources to conquer {thing_conquered}, costs {cost}"
-
-        self.world[position] = Terrain(LAND, player.name)
-        player.resources -= cost
-
-        enemy = target.owner
-        if enemy is None:
-            enemy = "neutral"
+        del change_log[:start - self.change_log_offset]
+        self.change_log_offset = start
 
-        return True, f"conquered {thing_conquered} from {enemy} spending {cost} resources"
-
-    def build(self, player, structure, position):
+    def apply_action(self, player, action):
         """
-        Fortify a position on the map, if possible. Return True if the action was successful.
+        Validate and apply the action of a player, emitting its event if someone is observing.
         """
-        cost = STRUCTURE_COST[structure]
+        if not self.observers:
+            return super().apply_action(player, action)
 
-        if player.resources < cost:
-            return False, f"not enough resources to build {structure}, costs {cost}"
+        resources = player.resources
+        previous_terrain = None
+        if isinstance(action, (list, tuple)) and len(action) == 2:
+            previous_terrain = self.world.get(action[1])
 
-        if position not in self.world:
-            return False, f"can't conquer a position that isn't on the map {position}"
+        result = super().apply_action(player, action)
 
-        if self.world[position].owner != player.name:
-            return False, "can't build structures on terrain that you don't own"
+        action_ok, reason = result
+        if not action_ok:
+            self.emit(Failed(self.turn_number, player.name, action, reason))
+        else:
+            action_type, position = action
+            if action_type == CONQUER:
+                self.emit(Conquered(
+                    self.turn_number, player.name, Position(*position), previous_terrain.structure,
+                    previous_terrain.owner, resources - player.resources,
+                ))
+            elif action_type == HARVEST:
+                self.emit(Harvested(self.turn_number, player.name, player.resources - resources))
+            else:
+                self.emit(Built(
+                    self.turn_number, player.name, Position(*position), action_type,
+                    resources - player.resources,
+                ))
 
-        if structure == CASTLE:
-            owned_castles = 0
-            owned_tiles = 0
-            for terrain in self.world.values():
-                if terrain.owner == player.name and terrain.structure == CASTLE:
-                    owned_castles += 1
-                if terrain.owner == player.name:
-                    owned_tiles += 1
+        return result
 
-            if owned_castles and owned_tiles / owned_castles <= TILES_PER_CASTLE_LIMIT:
-                return False, f"can't build more castles, you need more tiles (you have {owned_castles} castles and {owned_tiles} tiles)"
+    def subscribe(self, callback, *event_types):
+        """
+        Call callback(event) for every event of the given types (or of all the types, if none is
+        given) from now on. When nobody is subscribed, the game doesn't even build the events.
+        """
+        for event_type in event_types or EVENT_TYPES:
+            self.observers.setdefault(event_type, []).append(callback)
 
-        self.world[position] = Terrain(structure, player.name)
-        player.resources -= cost
-        return True, f"built {structure} spending {cost} resources"
+    def emit(self, event):
+        """
+        Send an event to the observers subscribed to its type.
+        """
+        for callback in self.observers.get(type(event), ()):
+            callback(event)
 
-    def adjacent_positions(self, position):
+    def copy_world_for_player(self, player):
         """
-        Return the valid positions adjacent to the given position, considering the map size.
+        Return a copy of the world to pass to the player (for safety with untrusted bots that
+        could modify it or keep it between turns), with their terrain positions having "mine" as
+        owner.
         """
-        x, y = position
-        candidates = [
-            Position(x - 1, y),
-            Position(x + 1, y),
-            Position(x, y - 1),
-            Position(x, y + 1),
-        ]
-        return [
-            candidate
-            for candidate in candidates
-            if candidate in self.world
-        ]
+        return dict(self.world.view_for(player.name).items())
 
     def update_alive_players(self):
         """
-        Mark dead players as dead.
+        Mark dead players as dead, and return them.
+        Instead of scanning the world, only the players that lost their last castle since the last
+        update are checked.
         """
-        # who has castles?
-        players_with_castles = set()
-        for terrain in self.world.values():
-            if terrain.owner and terrain.structure == CASTLE:
-                players_with_castles.add(terrain.owner)
+        castle_code = STRUCTURE_CODES[CASTLE]
+        died = []
 
-        # update alive/dead statuses
-        for player in self.players.values():
-            was_alive = player.alive
-            still_alive = player.name in players_with_castles
-            player.alive = still_alive
+        for owner_id in self.world.castleless_owner_ids:
+            if self.world.structure_counts[owner_id][castle_code]:
+                # got a castle back before the end of the turn
+                continue
+
+            player = self.players.get(self.world.owner_names[owner_id])
+            if player is not None and player.alive:
+                player.alive = False
+                died.append(player)
+                self.logger.info("%s died! It no longer has castles", player)
+                if self.observers:
+                    self.emit(Eliminated(self.turn_number, player.name))
+
+        self.world.castleless_owner_ids.clear()
 
-            if was_alive and not still_alive:
-                logging.info("%s died! It no longer has castles", player)
+        return died
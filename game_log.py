@@ -0,0 +1,55 @@
+import json
+import queue
+import threading
+
+from game import EVENT_NAMES, open_log_file
+
+
+class JsonlGameLog:
+    """
+    Structured log of a game: one JSON object per line for each event of the game (gzip compressed
+    if the path ends with ".gz").
+    The game only puts the events in a bounded queue, and a background thread formats and writes
+    them, so logging doesn't slow the game loop (unless the writer falls behind and the queue
+    fills up).
+    """
+    def __init__(self, path, queue_size=10000):
+        self.file = open_log_file(path)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def log_event(self, event):
+        """
+        Queue an event to be written.
+        """
+        self.queue.put(event)
+
+    def format_event(self, event):
+        """
+        Format an event as a JSON line.
+        """
+        return json.dumps({"event": EVENT_NAMES[type(event)], **event._asdict()}, default=repr) + "\n"
+
+    def write_loop(self):
+        """
+        Background loop that writes the queued events, flushing the file whenever it catches up
+        with the game (so the log can be read live).
+        """
+        while True:
+            event = self.queue.get()
+            if event is None:
+                break
+
+            self.file.write(self.format_event(event))
+            if self.queue.empty():
+                self.file.flush()
+
+        self.file.close()
+
+    def close(self):
+        """
+        Wait for the writer to write all the pending events, and close the log.
+        """
+        self.queue.put(None)
+        self.writer.join()
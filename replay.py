@@ -0,0 +1,312 @@
+import mmap
+import struct
+from bisect import bisect_right
+from collections import namedtuple
+
+import click
+
+from game import (
+    ACTION_CODES,
+    ACTIONS_BY_CODE,
+    CONQUER,
+    HARVEST,
+    NO_SEED,
+    Built,
+    Conquered,
+    Harvested,
+    Position,
+    ToE,
+    TurnEnd,
+    pack_text,
+    unpack_text,
+)
+
+MAGIC = b"TOER"
+VERSION = 2
+
+# records starting with these bytes instead of a player number mark the end of a turn, or a
+# keyframe (a snapshot of the game at the end of a turn)
+TURN_END = 255
+KEYFRAME = 254
+
+HEADER = struct.Struct("<4sBHHqBHI")
+POSITION = struct.Struct("<HH")
+KEYFRAME_TURN = struct.Struct("<I")
+PLAYER_STATE = struct.Struct("<q?")
+INDEX_ENTRY = struct.Struct("<IQ")
+# the file ends with the offset and size of the keyframes index
+FOOTER = struct.Struct("<QI4s")
+INDEX_MAGIC = b"TOEI"
+
+DEFAULT_KEYFRAME_INTERVAL = 100
+
+ReplayPlayer = namedtuple("ReplayPlayer", "name bot_type castle_position")
+ReplayAction = namedtuple("ReplayAction", "player_number action_type position")
+Keyframe = namedtuple("Keyframe", "turn offset")
+
+
+class ReplayWriter:
+    """
+    Writes the replay of a game in a compact binary format: a header with the map size, seed and
+    players (with their initial castles), and then only the actions that succeeded, since failed
+    actions don't change the game. Each action takes 2 bytes (6 if it has a position), and each
+    turn end takes 1 byte.
+    Every keyframe_interval turns a keyframe with the full state of the game is written too, and
+    the file ends with an index of the keyframes, so readers can jump to any turn.
+    """
+    def __init__(self, path, toe, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        self.file = open(path, "wb")
+        self.toe = toe
+        self.keyframe_interval = keyframe_interval
+        self.player_numbers = {name: number for number, name in enumerate(toe.players)}
+        self.keyframes = []
+
+        # games resumed from a checkpoint start their replay with a keyframe of the resumed turn
+        self.first_turn = self.turns = toe.turn_number - 1
+
+        seed = toe.seed if isinstance(toe.seed, int) else NO_SEED
+        self.file.write(HEADER.pack(
+            MAGIC, VERSION, toe.map_size.x, toe.map_size.y, seed, len(toe.players),
+            keyframe_interval, self.first_turn,
+        ))
+        for name, player in toe.players.items():
+            self.file.write(pack_text(name))
+            self.file.write(pack_text(player.bot_type))
+            self.file.write(POSITION.pack(*toe.initial_castles[name]))
+
+        if self.first_turn:
+            self.record_keyframe()
+
+        toe.subscribe(self.record_event, Conquered, Built, Harvested, TurnEnd)
+
+    def record_event(self, event):
+        """
+        Record an event of the game (successful actions and turn ends).
+        """
+        if isinstance(event, TurnEnd):
+            self.record_turn_end()
+        elif isinstance(event, Conquered):
+            self.record_action(event.player, CONQUER, event.position)
+        elif isinstance(event, Harvested):
+            self.record_action(event.player, HARVEST, None)
+        else:
+            self.record_action(event.player, event.structure, event.position)
+
+    def record_action(self, player_name, action_type, position):
+        """
+        Record an action that a player did successfully.
+        """
+        record = bytes([self.player_numbers[player_name], ACTION_CODES[action_type]])
+        if action_type != HARVEST:
+            record += POSITION.pack(*position)
+        self.file.write(record)
+
+    def record_turn_end(self):
+        """
+        Record the end of a turn, and a keyframe if it's time for one.
+        """
+        self.file.write(bytes([TURN_END]))
+        self.turns += 1
+
+        if self.keyframe_interval and self.turns % self.keyframe_interval == 0:
+            self.record_keyframe()
+
+    def record_keyframe(self):
+        """
+        Record a snapshot of the game at the end of the current turn.
+        """
+        self.keyframes.append(Keyframe(self.turns, self.file.tell()))
+
+        self.file.write(bytes([KEYFRAME]))
+        self.file.write(KEYFRAME_TURN.pack(self.turns))
+        for player in self.toe.players.values():
+            self.file.write(PLAYER_STATE.pack(player.resources, player.alive))
+        self.file.write(self.toe.world.structures)
+        self.file.write(self.toe.world.owners)
+
+    def close(self):
+        """
+        Write the keyframes index and close the file.
+        """
+        index_offset = self.file.tell()
+        for keyframe in self.keyframes:
+            self.file.write(INDEX_ENTRY.pack(*keyframe))
+        self.file.write(FOOTER.pack(index_offset, len(self.keyframes), INDEX_MAGIC))
+        self.file.close()
+
+
+class ReplayReader:
+    """
+    Reads a replay written by a ReplayWriter. The file is memory mapped, so only the parts needed
+    to get to a turn are read.
+    """
+    def __init__(self, path):
+        with open(path, "rb") as replay_file:
+            self.data = mmap.mmap(replay_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.width, self.height, seed, players_count,
+         self.keyframe_interval, self.first_turn) = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} isn't a replay file of a supported version")
+        self.seed = None if seed == NO_SEED else seed
+
+        offset = HEADER.size
+        self.players = []
+        for _ in range(players_count):
+            name, offset = unpack_text(self.data, offset)
+            bot_type, offset = unpack_text(self.data, offset)
+            castle_position = Position(*POSITION.unpack_from(self.data, offset))
+            offset += POSITION.size
+            self.players.append(ReplayPlayer(name, bot_type, castle_position))
+
+        self.actions_offset = offset
+        self.keyframe_size = (
+            1 + KEYFRAME_TURN.size + PLAYER_STATE.size * players_count + self.width * self.height * 2
+        )
+        self.read_index()
+
+    def read_index(self):
+        """
+        Read the keyframes index from the end of the file. If the game didn't finish writing it
+        (for instance, it crashed), the keyframes are found by scanning the actions instead.
+        """
+        self.keyframes = []
+        self.actions_end = len(self.data)
+
+        if len(self.data) >= self.actions_offset + FOOTER.size:
+            index_offset, keyframes_count, magic = FOOTER.unpack_from(self.data, len(self.data) - FOOTER.size)
+            if magic == INDEX_MAGIC:
+                self.actions_end = index_offset
+                self.keyframes = [
+                    Keyframe(*INDEX_ENTRY.unpack_from(self.data, index_offset + INDEX_ENTRY.size * number))
+                    for number in range(keyframes_count)
+                ]
+                return
+
+        for _ in self.iter_turns(on_keyframe=self.keyframes.append):
+            pass
+
+    def iter_turns(self, offset=None, on_keyframe=None):
+        """
+        Iterate the turns of the game, yielding the list of actions of each turn.
+        """
+        data = self.data
+        if offset is None:
+            offset = self.actions_offset
+
+        actions = []
+        while offset < self.actions_end:
+            player_number = data[offset]
+            if player_number == TURN_END:
+                yield actions
+                actions = []
+                offset += 1
+                continue
+            elif player_number == KEYFRAME:
+                if offset + self.keyframe_size > self.actions_end:
+                    # truncated keyframe at the end of an unfinished replay
+                    break
+                if on_keyframe:
+                    on_keyframe(Keyframe(KEYFRAME_TURN.unpack_from(data, offset + 1)[0], offset))
+                offset += self.keyframe_size
+                continue
+
+            action_type = ACTIONS_BY_CODE[data[offset + 1]]
+            offset += 2
+            position = None
+            if action_type != HARVEST:
+                position = Position(*POSITION.unpack_from(data, offset))
+                offset += POSITION.size
+            actions.append(ReplayAction(player_number, action_type, position))
+
+    def new_game(self, **toe_kwargs):
+        """
+        Create the game of the replay, in its initial state (no bots are started).
+        The game has no log, unless a log path is specified.
+        """
+        if "log_path" not in toe_kwargs:
+            toe_kwargs.setdefault("log_format", "none")
+        toe = ToE(self.width, self.height, seed=self.seed, **toe_kwargs)
+        for player in self.players:
+            toe.add_player(player.name, player.bot_type, castle_position=player.castle_position)
+        return toe
+
+    def load_keyframe(self, toe, keyframe):
+        """
+        Restore the state of the game from a keyframe.
+        """
+        offset = keyframe.offset + 1 + KEYFRAME_TURN.size
+        for player in toe.players.values():
+            player.resources, player.alive = PLAYER_STATE.unpack_from(self.data, offset)
+            offset += PLAYER_STATE.size
+
+        size = self.width * self.height
+        toe.world.restore(self.data[offset:offset + size], self.data[offset + size:offset + size * 2])
+
+    def replay(self, until_turn=None, **toe_kwargs):
+        """
+        Fast forward a game to the end of a turn (or to the end of the game), and return it with
+        the number of turns replayed.
+        The game starts from the nearest keyframe before the turn, so only the remaining actions
+        are applied.
+        """
+        if until_turn is not None and until_turn < self.first_turn:
+            raise ValueError(f"the replay starts at turn {self.first_turn} (resumed from a checkpoint)")
+
+        toe = self.new_game(**toe_kwargs)
+
+        keyframes = self.keyframes
+        if until_turn is not None:
+            keyframes = keyframes[:bisect_right([keyframe.turn for keyframe in keyframes], until_turn)]
+
+        if keyframes:
+            keyframe = keyframes[-1]
+            self.load_keyframe(toe, keyframe)
+            turns = self.iter_turns(offset=keyframe.offset + self.keyframe_size)
+            return toe, self.fast_forward(toe, turns, until_turn, turns_played=keyframe.turn)
+        else:
+            return toe, self.fast_forward(toe, self.iter_turns(), until_turn)
+
+    def fast_forward(self, toe, turns, until_turn=None, turns_played=0):
+        """
+        Apply the actions of the turns to the game, until the end of a turn (or the end of the
+        turns), and return the number of the last turn played.
+        """
+        players = list(toe.players.values())
+        for actions in turns:
+            if until_turn is not None and turns_played >= until_turn:
+                break
+
+            for player_number, action_type, position in actions:
+                toe.apply_action(players[player_number], (action_type, position))
+            toe.update_alive_players()
+            turns_played += 1
+
+        return turns_played
+
+    def close(self):
+        self.data.close()
+
+
+@click.command()
+@click.argument("replay_path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--turn", type=int, default=None, help="Show the game at the end of this turn (the end of the game if not specified).")
+@click.option("--log-path", type=click.Path(), default="./replay.log", help="Path for the log file of the replayed game.")
+def main(replay_path, turn, log_path):
+    """
+    Show the state of a replayed game of Terminal of Empires.
+    """
+    from ui import ToEUI  # the ui is only needed when running as a script
+
+    reader = ReplayReader(replay_path)
+    toe, turns_played = reader.replay(until_turn=turn, log_path=log_path)
+    toe.close_logs()
+
+    ui = ToEUI(turn_delay=0)
+    for player in toe.players.values():
+        ui.add_player(player)
+    ui.render(toe, turns_played, running_in_fullscreen=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+import os
+import signal
+import sys
+from collections import namedtuple
+from itertools import islice
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import wait
+
+from event_store import EventStore
+from game import ToE
+
+GameResult = namedtuple("GameResult", "game_number winners turns_played")
+
+
+def numbered_path(path, game_number):
+    """
+    Build the path of a file (like a log) of a game that is part of a series of games, so they don't
+    share the same file.
+    """
+    root, extension = os.path.splitext(path)
+    return f"{root}.{game_number}{extension}"
+
+
+def run_game(game_number, width, height, players, log_path, turn_timeout, max_turns, debug=False,
+             safe_world_copies=False, ui=None, seed=None, replay_path=None, checkpoint_path=None,
+             checkpoint_every=None, resume_path=None, dataset_path=None, log_format="text",
+             events_db_path=None):
+    """
+    Run a single game until the end, and return its result.
+    The players are a list of (name, bot_type, castle_position) tuples.
+    If a resume path is specified, the game (including its size and players) is loaded from that
+    checkpoint instead.
+    If a dataset path is specified, the turns of the players are recorded there as a training
+    dataset.
+    If an events database path is specified, the events of the game are stored there.
+    """
+    recorder = None
+    if dataset_path:
+        from dataset import DatasetRecorder  # numpy is only needed when recording datasets
+        recorder = DatasetRecorder(dataset_path, game_number=game_number, seed=seed)
+
+    toe_kwargs = dict(
+        ui=ui, log_path=log_path, turn_timeout=turn_timeout, debug=debug,
+        safe_world_copies=safe_world_copies, replay_path=replay_path,
+        checkpoint_path=checkpoint_path, checkpoint_every=checkpoint_every, recorder=recorder,
+        log_format=log_format,
+    )
+
+    if resume_path:
+        toe = ToE.load_checkpoint(resume_path, **toe_kwargs)
+    else:
+        toe = ToE(width, height, seed=seed, **toe_kwargs)
+
+        for name, bot_type, castle_position in players:
+            toe.add_player(name, bot_type, castle_position=castle_position)
+
+    event_store = None
+    if events_db_path:
+        event_store = EventStore(events_db_path)
+        event_store.record_game(toe)
+
+    try:
+        if ui:
+            with ui.show():
+                winners, turns_played = toe.play(max_turns=max_turns)
+        else:
+            winners, turns_played = toe.play(max_turns=max_turns)
+    finally:
+        if recorder:
+            recorder.close()
+        if event_store:
+            event_store.close()
+
+    return GameResult(game_number, [winner.name for winner in winners], turns_played)
+
+
+def run_game_process(connection, game):
+    """
+    Run a game (a dict of run_game arguments) in its own process, and send its result (or the
+    error that stopped it) through the connection.
+    The process exits cleanly when it's terminated, so the running game still stops the bots
+    subprocesses and closes its files.
+    """
+    signal.signal(signal.SIGTERM, exit_game_process)
+    try:
+        connection.send((run_game(**game), None))
+    except Exception as err:
+        connection.send((None, err))
+
+
+def exit_game_process(signal_number, frame):
+    """
+    Exit the game process, ignoring repeated terminations while the game stops.
+    """
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    sys.exit(1)
+
+
+def run_games_in_parallel(games, jobs):
+    """
+    Run many games (each one specified as a dict of run_game arguments) using up to jobs
+    processes, and yield their results as they finish.
+    Each game runs in a fresh process, so games don't share logging configs or bot module state.
+    If the caller stops early (closing the generator, or on an error), the games waiting to start
+    are never started, and the running ones are stopped, terminating their processes.
+    """
+    games = iter(games)
+    # the processes of the running games, by the connection they send their result through
+    running = {}
+    try:
+        while True:
+            for game in islice(games, jobs - len(running)):
+                connection, game_connection = Pipe(duplex=False)
+                process = Process(target=run_game_process, args=(game_connection, game))
+                process.start()
+                game_connection.close()
+                running[connection] = process
+
+            if not running:
+                break
+
+            for connection in wait(list(running)):
+                process = running.pop(connection)
+                try:
+                    result, error = connection.recv()
+                except EOFError:
+                    result, error = None, None
+                process.join()
+                connection.close()
+
+                if error is not None:
+                    raise error
+                if result is None:
+                    raise RuntimeError(f"a game process died without a result (exit code {process.exitcode})")
+                yield result
+    finally:
+        for process in running.values():
+            process.terminate()
+        for connection, process in running.items():
+            process.join()
+            connection.close()
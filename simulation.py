@@ -0,0 +1,78 @@
+from game import MINE, GameRules, WorldGrid
+
+
+class SimulatedPlayer:
+    """
+    A player inside a simulation, just a name and its resources.
+    """
+    def __init__(self, name, resources=0):
+        self.name = name
+        self.resources = resources
+
+    def __str__(self):
+        return self.name
+
+
+class Simulation(GameRules):
+    """
+    A forward model of the game, for bots that want to search ahead (minimax, MCTS, etc).
+    It applies actions with the same rules of the real game, and every action can be undone in
+    O(1), so a search can explore many actions without copying the world.
+    """
+    def __init__(self, world, resources):
+        self.world = world
+        self.players = {
+            name: SimulatedPlayer(name, resources.get(name, 0))
+            for name in world.owner_names[1:]
+        }
+        self.history = []
+
+    @classmethod
+    def from_turn(cls, map_size, my_resources, world, enemies_resources=None):
+        """
+        Build a simulation from the arguments that a bot receives in its turn() method. The world
+        is copied once, and the resources of the enemies (unknown to the bot) are 0 unless
+        specified as a dict of name -> resources.
+        """
+        grid = WorldGrid.from_world(*map_size, world)
+        grid.owner_id(MINE)
+
+        resources = dict(enemies_resources or {})
+        resources[MINE] = my_resources
+
+        return cls(grid, resources)
+
+    def apply(self, action, player_name=MINE):
+        """
+        Apply an action of a player (by default, the bot itself), returning the (success, reason)
+        result of the game rules. Failed actions are recorded too, so every apply can be undone.
+        """
+        player = self.players[player_name]
+
+        try:
+            _, position = action
+            index = self.world.index(position)
+            previous_tile = (index, self.world.structures[index], self.world.owners[index])
+        except (TypeError, ValueError, KeyError):
+            previous_tile = None
+
+        self.history.append((player, player.resources, previous_tile))
+        return self.apply_action(player, action)
+
+    def undo(self):
+        """
+        Undo the last applied action.
+        """
+        player, resources, previous_tile = self.history.pop()
+        player.resources = resources
+
+        if previous_tile is not None:
+            index, structure_code, owner_id = previous_tile
+            if (self.world.structures[index], self.world.owners[index]) != (structure_code, owner_id):
+                self.world.set_tile(index, structure_code, owner_id)
+
+    def resources(self, player_name=MINE):
+        """
+        Current resources of a player in the simulation.
+        """
+        return self.players[player_name].resources
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# the modules of the game live at the root of the repo
+sys.path.insert(0, str(Path(__file__).parent.parent))
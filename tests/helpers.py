@@ -0,0 +1,54 @@
+"""
+Helpers to check the indexes that the world keeps up to date against brute force computations over
+whole worlds, while playing real games.
+"""
+from game import MINE, ToE, WorldView
+
+BOTS = ("aggressive", "defensive", "pacifist", "super_random")
+SEEDS = (0, 1, 2)
+
+
+def by_row(positions):
+    return sorted(positions, key=lambda position: (position.y, position.x))
+
+
+def new_game(seed, width=20, height=10):
+    """
+    Create a game between the BOTS, in debug mode and without logs.
+    """
+    toe = ToE(width, height, debug=True, seed=seed, log_format="none")
+    for number, bot_type in enumerate(BOTS):
+        toe.add_player(f"p{number}", bot_type)
+    return toe
+
+
+def play(seed, check_turn, width=20, height=10, max_turns=120):
+    """
+    Play a game between the BOTS, calling check_turn(toe, player) after each turn.
+    """
+    toe = new_game(seed, width, height)
+
+    run_player_turn = toe.run_player_turn
+
+    def checked_run_player_turn(player):
+        result = run_player_turn(player)
+        check_turn(toe, player)
+        return result
+
+    toe.run_player_turn = checked_run_player_turn
+    toe.play(max_turns=max_turns)
+    return toe
+
+
+def views(toe, player):
+    """
+    A view of the world for the player, sharing the indexes of the game, and a fresh one built from
+    a copy of its arrays (so its indexes are built from scratch).
+    """
+    view = toe.world.view_for(player.name)
+    fresh = WorldView(view.width, view.height, bytes(view.structures), bytes(view.owners), view.terrains)
+    return view, fresh
+
+
+def owners(toe, player):
+    return [MINE, None] + [name for name in toe.players if name != player.name]
@@ -0,0 +1,8 @@
+import pytest
+
+from batched_env import differential_check
+
+
+@pytest.mark.parametrize("players", [2, 4])
+def test_batched_games_match_toe(players):
+    differential_check(games=16, width=20, height=10, players=players, turns=80, seed=players)
@@ -0,0 +1,60 @@
+"""
+The actions returned by the bots are read once, the same way with and without observers.
+"""
+import pytest
+
+import game
+from game import ToE
+
+
+class SneakyAction(tuple):
+    """
+    An action that gives resources to whoever reads it.
+    """
+    def __iter__(self):
+        self.reader.resources += 5
+        return super().__iter__()
+
+    def __getitem__(self, index):
+        self.reader.resources += 5
+        return super().__getitem__(index)
+
+    def __len__(self):
+        self.reader.resources += 5
+        return super().__len__()
+
+
+class SneakyBot:
+    def __init__(self):
+        self.player = None
+
+    def turn(self, map_size, my_resources, world):
+        action = SneakyAction(("harvest", None))
+        action.reader = self.player
+        return action
+
+
+@pytest.fixture(autouse=True)
+def sneaky_bot(monkeypatch):
+    import_bot_logic = game.import_bot_logic
+    monkeypatch.setattr(
+        game, "import_bot_logic",
+        lambda bot_type: SneakyBot() if bot_type == "sneaky" else import_bot_logic(bot_type),
+    )
+
+
+@pytest.mark.parametrize("observed", [False, True])
+def test_actions_are_read_once_as_plain_tuples(observed):
+    toe = ToE(20, 10, debug=True, seed=1, log_format="none")
+    toe.add_player("sneaky", "sneaky")
+    toe.add_player("pacifist", "pacifist")
+    if observed:
+        toe.subscribe(lambda event: None)
+
+    player = toe.players["sneaky"]
+    player.start_bot_logic()
+    player.debug_bot_logic.player = player
+    for _ in range(3):
+        toe.run_player_turn(player)
+
+    assert player.resources == 3 * toe.world.stats("sneaky").production
@@ -0,0 +1,165 @@
+"""
+Games with the bots running in subprocesses (the default mode), talking to the game through pipes
+and getting the world through shared memory.
+The test bots are patched into import_bot_logic, so the subprocesses must be forked.
+"""
+import multiprocessing
+import os
+import time
+
+import pytest
+
+import game
+from game import Conquered, Failed, ToE, WorldView
+
+pytestmark = pytest.mark.skipif(
+    multiprocessing.get_start_method() != "fork",
+    reason="the test bots only reach the bot subprocesses when they are forked",
+)
+
+
+class CheckingBot:
+    """
+    An aggressive bot that checks the world it gets, and the world it keeps from the turn deltas.
+    """
+    def __init__(self):
+        self.bot_logic = game.import_bot_logic("aggressive")
+        self.known = None
+
+    def turn_delta(self, changes, turn_number):
+        if changes is None:
+            self.known = None
+        else:
+            self.known.update(changes)
+
+    def turn(self, map_size, my_resources, world):
+        if self.known is None:
+            self.known = dict(world.items())
+        assert self.known == dict(world.items()), "turn deltas out of sync"
+
+        if isinstance(world, WorldView):
+            # the defenses and frontiers come from shared memory, instead of being built from the
+            # arrays
+            fresh = WorldView(world.width, world.height, bytes(world.structures), bytes(world.owners), world.terrains)
+            assert bytes(world.conquer_cost_map()) == bytes(fresh.conquer_cost_map()), "wrong conquer costs"
+            for terrains in world.terrains:
+                owner = terrains[0].owner
+                assert world.frontier(owner) == fresh.frontier(owner), "wrong frontier"
+        return self.bot_logic.turn(map_size, my_resources, world)
+
+
+class HangingBot:
+    """
+    A bot that never finishes its turns.
+    """
+    def turn(self, map_size, my_resources, world):
+        while True:
+            time.sleep(1)
+
+
+class SlowBot:
+    """
+    An aggressive bot that thinks too much on its second turn.
+    """
+    def __init__(self):
+        self.bot_logic = game.import_bot_logic("aggressive")
+        self.turns = 0
+
+    def turn(self, map_size, my_resources, world):
+        self.turns += 1
+        if self.turns == 2:
+            time.sleep(1)
+        return self.bot_logic.turn(map_size, my_resources, world)
+
+
+class DyingBot:
+    """
+    A bot whose process dies on its third turn.
+    """
+    def __init__(self):
+        self.turns = 0
+
+    def turn(self, map_size, my_resources, world):
+        self.turns += 1
+        if self.turns == 3:
+            os._exit(1)
+        return "harvest", None
+
+
+TEST_BOTS = {
+    "checking": CheckingBot,
+    "hanging": HangingBot,
+    "slow": SlowBot,
+    "dying": DyingBot,
+}
+
+
+@pytest.fixture(autouse=True)
+def test_bots(monkeypatch):
+    import_bot_logic = game.import_bot_logic
+
+    def import_test_bot_logic(bot_type):
+        if bot_type in TEST_BOTS:
+            return TEST_BOTS[bot_type]()
+        return import_bot_logic(bot_type)
+
+    monkeypatch.setattr(game, "import_bot_logic", import_test_bot_logic)
+
+
+def play(bot_types, max_turns, turn_timeout=0.5, **toe_kwargs):
+    """
+    Play a game in subprocess mode, returning the game, its turns played and its events.
+    """
+    toe = ToE(20, 10, seed=1, turn_timeout=turn_timeout, log_format="none", **toe_kwargs)
+    for number, bot_type in enumerate(bot_types):
+        toe.add_player(f"p{number}", bot_type)
+
+    events = []
+    toe.subscribe(events.append, Conquered, Failed)
+    _, turns_played = toe.play(max_turns=max_turns)
+    return toe, turns_played, events
+
+
+def failures(events, player_name):
+    return [event.reason for event in events if isinstance(event, Failed) and event.player == player_name]
+
+
+@pytest.mark.parametrize("safe_world_copies", [False, True])
+def test_bots_get_the_world_of_each_turn(safe_world_copies):
+    toe, _, events = play(["checking", "checking", "defensive"], max_turns=60, turn_timeout=2,
+                          safe_world_copies=safe_world_copies)
+
+    assert not failures(events, "p0") and not failures(events, "p1")
+    assert any(isinstance(event, Conquered) and event.player == "p0" for event in events)
+    assert toe.shared_world is None
+
+
+@pytest.mark.parametrize("safe_world_copies", [False, True])
+def test_hanging_bot_loses_its_turns(safe_world_copies):
+    _, turns_played, events = play(["hanging", "pacifist"], max_turns=200, turn_timeout=0.01,
+                                   safe_world_copies=safe_world_copies)
+
+    assert turns_played == 200
+    reasons = failures(events, "p0")
+    assert len(reasons) == 199
+    assert reasons[0].startswith("timeout, did not return")
+    assert all(reason == "timeout, still thinking a previous turn" for reason in reasons[1:])
+
+
+def test_slow_bot_plays_again_after_its_late_answer():
+    _, _, events = play(["slow", "pacifist"], max_turns=40, turn_timeout=0.2)
+
+    reasons = failures(events, "p0")
+    assert reasons and all(reason.startswith("timeout") for reason in reasons)
+    late_turn = max(event.turn for event in events if isinstance(event, Failed) and event.player == "p0")
+    assert any(
+        isinstance(event, Conquered) and event.player == "p0" and event.turn > late_turn
+        for event in events
+    )
+
+
+def test_dead_bot_loses_its_turns():
+    _, turns_played, events = play(["dying", "pacifist"], max_turns=30)
+
+    assert turns_played == 30
+    assert failures(events, "p0")[-1] == "bot process died"
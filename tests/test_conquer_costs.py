@@ -0,0 +1,28 @@
+"""
+The defenses and conquer costs of the tiles that the world keeps up to date, compared against the
+neighbours of each tile, while playing real games.
+"""
+import pytest
+
+from game import CONQUER_COSTS, DEFENDER_STRUCTURES
+from helpers import SEEDS, play, views
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_defenses_and_conquer_costs(seed):
+    def check_turn(toe, player):
+        view, fresh = views(toe, player)
+        for position, terrain in view.items():
+            defended = any(
+                view[adjacent].structure in DEFENDER_STRUCTURES and view[adjacent].owner == terrain.owner
+                for adjacent in toe.adjacent_positions(position)
+            )
+            cost = CONQUER_COSTS[terrain.structure]
+            if isinstance(cost, tuple):
+                cost = cost[defended]
+
+            assert view.is_defended(position) == fresh.is_defended(position) == defended
+            assert view.conquer_cost(position) == fresh.conquer_cost(position) == cost
+            assert view.conquer_cost_map()[view.index(position)] == cost
+
+    play(seed, check_turn)
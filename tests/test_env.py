@@ -0,0 +1,25 @@
+"""
+The gym style environment, where an agent plays against bots run in the same process.
+"""
+import pytest
+
+from env import ToEEnv
+from game import HARVEST
+
+
+def test_agent_plays_until_the_end_of_the_game():
+    env = ToEEnv(20, 10, max_turns=2)
+    observation = env.reset(seed=1)
+    assert observation["world"].shape == (2, 10, 20)
+
+    _, reward, done, info = env.step((HARVEST, None))
+    env.close()
+
+    assert done and reward == 0
+    assert info["action_ok"]
+
+
+@pytest.mark.parametrize("max_turns", [0, 1])
+def test_games_without_agent_turns_are_rejected(max_turns):
+    with pytest.raises(ValueError):
+        ToEEnv(20, 10, max_turns=max_turns)
@@ -0,0 +1,28 @@
+"""
+The frontier of each owner that the world keeps up to date, compared against the neighbours of
+all its tiles, while playing real games.
+"""
+import pytest
+
+from helpers import SEEDS, by_row, owners, play, views
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_frontier_index(seed):
+    def check_turn(toe, player):
+        view, fresh = views(toe, player)
+        for owner in owners(toe, player):
+            if owner is None:
+                assert view.frontier(owner) == []
+                continue
+
+            expected = by_row({
+                adjacent
+                for position, terrain in view.items()
+                if terrain.owner == owner
+                for adjacent in toe.adjacent_positions(position)
+                if view[adjacent].owner != owner
+            })
+            assert view.frontier(owner) == fresh.frontier(owner) == expected
+
+    play(seed, check_turn)
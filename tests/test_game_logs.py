@@ -0,0 +1,88 @@
+"""
+The log of a game: the messages that bots log end up in it, and games that never play don't touch
+it.
+"""
+import gc
+import logging
+import multiprocessing
+
+import pytest
+
+import game
+from game import ToE
+from replay import ReplayReader
+
+
+class LoggingBot:
+    """
+    A bot that logs like the bots of the pycamp do, through the root logger.
+    """
+    def turn(self, map_size, my_resources, world):
+        logging.warning("PANIC")
+        logging.info("harvesting with %s resources", my_resources)
+        logging.debug("too detailed for the game log")
+        return "harvest", None
+
+
+@pytest.fixture(autouse=True)
+def logging_bot(monkeypatch):
+    import_bot_logic = game.import_bot_logic
+
+    def import_test_bot_logic(bot_type):
+        if bot_type == "logging":
+            return LoggingBot()
+        return import_bot_logic(bot_type)
+
+    monkeypatch.setattr(game, "import_bot_logic", import_test_bot_logic)
+
+
+@pytest.mark.parametrize("debug", [
+    True,
+    pytest.param(False, marks=pytest.mark.skipif(
+        multiprocessing.get_start_method() != "fork",
+        reason="the test bot only reaches the bot subprocesses when they are forked",
+    )),
+])
+def test_bot_messages_go_to_the_game_log(debug, tmp_path, capfd):
+    root_handlers = list(logging.getLogger().handlers)
+    log_path = tmp_path / "toe.log"
+    toe = ToE(20, 10, seed=1, debug=debug, turn_timeout=2, log_path=str(log_path))
+    toe.add_player("p0", "logging")
+    toe.add_player("p1", "pacifist")
+    toe.play(max_turns=5)
+
+    log = log_path.read_text()
+    assert log.count("p0:logging bot logged: PANIC") == 4
+    assert "p0:logging bot logged: harvesting with" in log
+    assert "too detailed" not in log
+    assert capfd.readouterr().err == ""
+    # the logging config of the game process is left as it was
+    assert logging.getLogger().handlers == root_handlers
+
+
+def test_replayed_games_dont_touch_the_game_log(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    toe = ToE(20, 10, seed=1, debug=True, log_format="none", replay_path="game.replay")
+    toe.add_player("p0", "aggressive")
+    toe.add_player("p1", "pacifist")
+    toe.play(max_turns=10)
+
+    (tmp_path / "toe.log").write_text("the log of another game\n")
+    reader = ReplayReader("game.replay")
+    replayed, turns_played = reader.replay()
+    reader.close()
+
+    assert turns_played == 9
+    assert replayed.log_handler is None
+    assert (tmp_path / "toe.log").read_text() == "the log of another game\n"
+
+
+def test_games_that_never_play_close_their_log(tmp_path):
+    toe = ToE(20, 10, seed=1, log_path=str(tmp_path / "toe.log"))
+    log_file = toe.log_handler.stream
+
+    del toe
+    gc.collect()
+
+    assert log_file.closed
+    assert (tmp_path / "toe.log").read_text().endswith("game created with size 20 x 10\n")
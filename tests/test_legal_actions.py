@@ -0,0 +1,30 @@
+"""
+The legal action masks that the world builds from its indexes, compared against what the game
+rules allow, while playing real games.
+"""
+import pytest
+
+from game import ACTIONS_BY_CODE, HARVEST
+from helpers import SEEDS, play
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_legal_actions(seed):
+    def check_turn(toe, player):
+        if not player.alive:
+            return
+
+        legal = toe.legal_actions(player)
+        structures, owners, resources = bytes(toe.world.structures), bytes(toe.world.owners), player.resources
+        for action_type in ACTIONS_BY_CODE:
+            if action_type == HARVEST:
+                continue
+
+            for index, is_legal in enumerate(getattr(legal, action_type)):
+                applied, reason = toe.apply_action(player, (action_type, toe.world.position(index)))
+                if applied:
+                    toe.world.restore(structures, owners)
+                    player.resources = resources
+                assert applied == bool(is_legal), (action_type, toe.world.position(index), reason)
+
+    play(seed, check_turn, width=12, height=8, max_turns=40)
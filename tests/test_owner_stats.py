@@ -0,0 +1,22 @@
+"""
+The counters of tiles, structures and production that the world keeps for each owner, compared
+against counts over the whole world, while playing real games.
+"""
+import pytest
+
+from game import HARVEST_PRODUCTION
+from helpers import SEEDS, play
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_stats(seed):
+    def check_turn(toe, player):
+        for name in toe.players:
+            terrains = [terrain for terrain in toe.world.values() if terrain.owner == name]
+            stats = toe.world.stats(name)
+            assert stats.tiles == len(terrains)
+            for structure, count in (("farm", stats.farms), ("fort", stats.forts), ("castle", stats.castles)):
+                assert count == sum(terrain.structure == structure for terrain in terrains)
+            assert stats.production == sum(HARVEST_PRODUCTION[terrain.structure] for terrain in terrains)
+
+    play(seed, check_turn)
@@ -0,0 +1,47 @@
+"""
+Games run in parallel, each one in its own process.
+"""
+import multiprocessing
+
+import pytest
+
+from runner import numbered_path, run_games_in_parallel
+
+
+def game(tmp_path, game_number, max_turns, turn_timeout=0.5):
+    return dict(
+        game_number=game_number, width=20, height=10,
+        players=[("a", "aggressive", None), ("b", "pacifist", None)],
+        log_path=numbered_path(str(tmp_path / "toe.log"), game_number), turn_timeout=turn_timeout,
+        max_turns=max_turns, debug=True, seed=game_number,
+    )
+
+
+def test_games_run_in_parallel(tmp_path):
+    games = [game(tmp_path, game_number, max_turns=20) for game_number in range(5)]
+    results = list(run_games_in_parallel(games, jobs=2))
+
+    assert sorted(result.game_number for result in results) == list(range(5))
+    assert all(result.turns_played <= 20 for result in results)
+    assert multiprocessing.active_children() == []
+
+
+def test_stopping_early_stops_the_running_games(tmp_path):
+    games = [game(tmp_path, 0, max_turns=5)] + [game(tmp_path, number, max_turns=10 ** 9) for number in (1, 2, 3)]
+    results = run_games_in_parallel(games, jobs=3)
+
+    assert next(results).game_number == 0
+    results.close()
+
+    assert multiprocessing.active_children() == []
+    # the running games were stopped, and the waiting one never started
+    assert (tmp_path / "toe.1.log").exists()
+    assert not (tmp_path / "toe.3.log").exists()
+
+
+def test_errors_of_games_are_raised(tmp_path):
+    games = [game(tmp_path, 0, max_turns=5, turn_timeout=None), game(tmp_path, 1, max_turns=10 ** 9)]
+
+    with pytest.raises(TypeError):
+        list(run_games_in_parallel(games, jobs=2))
+    assert multiprocessing.active_children() == []
@@ -0,0 +1,35 @@
+"""
+The tiles of each owner and structure that the world keeps indexed, compared against scans of the
+whole world, while playing real games.
+"""
+import pytest
+
+from game import MINE, STRUCTURES_BY_CODE
+from helpers import SEEDS, by_row, owners, play, views
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_tile_index(seed):
+    def check_turn(toe, player):
+        view, fresh = views(toe, player)
+        items = list(view.items())
+        for owner in owners(toe, player):
+            for structure in (None,) + STRUCTURES_BY_CODE:
+                expected = by_row(
+                    position for position, terrain in items
+                    if terrain.owner == owner and structure in (None, terrain.structure)
+                )
+                assert view.tiles_of(owner, structure) == expected
+                assert fresh.tiles_of(owner, structure) == expected
+
+        for structure in STRUCTURES_BY_CODE:
+            expected = by_row(position for position, terrain in items if terrain.structure == structure)
+            assert view.tiles_with(structure) == fresh.tiles_with(structure) == expected
+
+            expected = by_row(
+                position for position, terrain in items
+                if terrain.structure == structure and terrain.owner not in (None, MINE)
+            )
+            assert view.enemy_tiles(structure) == fresh.enemy_tiles(structure) == expected
+
+    play(seed, check_turn)
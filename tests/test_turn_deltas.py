@@ -0,0 +1,55 @@
+"""
+The turn deltas sent to the bots, replayed by a bot that must stay in sync with the world of each
+turn, while playing real games.
+"""
+import pytest
+
+from helpers import SEEDS, new_game
+
+
+class DeltaTracker:
+    """
+    A bot that keeps its own copy of the world only from the turn deltas, checking it against the
+    world of each turn.
+    """
+    def __init__(self, bot_logic):
+        self.bot_logic = bot_logic
+        self.known = None
+        self.turns_checked = 0
+
+    def turn_delta(self, changes, turn_number):
+        if changes is None:
+            self.known = None
+        else:
+            self.known.update(changes)
+
+    def turn(self, map_size, my_resources, world):
+        if self.known is None:
+            self.known = dict(world.items())
+        assert self.known == dict(world.items())
+        self.turns_checked += 1
+        return self.bot_logic.turn(map_size, my_resources, world)
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_turn_deltas(seed):
+    toe = new_game(seed)
+    start_bot_logic = [player.start_bot_logic for player in toe.players.values()]
+    trackers = []
+
+    def tracked_start_bot_logic(player, start_bot_logic):
+        def start(*args, **kwargs):
+            start_bot_logic(*args, **kwargs)
+            player.debug_bot_logic = DeltaTracker(player.debug_bot_logic)
+            trackers.append(player.debug_bot_logic)
+        return start
+
+    for player, start in zip(toe.players.values(), start_bot_logic):
+        player.start_bot_logic = tracked_start_bot_logic(player, start)
+
+    _, turns_played = toe.play(max_turns=120)
+
+    assert len(trackers) == len(toe.players)
+    assert max(tracker.turns_checked for tracker in trackers) == turns_played - 1
+    # the changes already seen by every alive player are forgotten
+    assert len(toe.world.change_log) <= len(toe.world.structures)
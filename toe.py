@@ -1,79 +1,127 @@
 import sys
 from collections import defaultdict
+from time import monotonic
 
 import click
 
-from game import ToE
+from event_store import EventStore
+from game import LOG_FORMATS
+from runner import numbered_path, run_game, run_games_in_parallel
 from ui import ToEUI
 
 BANNED_BOTS = {"orden66"}
 
 
-@click.command()
+@click.group(invoke_without_command=True)
 @click.option("--width", type=int, default=40, help="The width of the map.")
 @click.option("--height", type=int, default=20, help="The height of the map.")
 @click.option("--players", type=str, help="Players, specified as a comma separated list of player_name:bot_type (or optionally with the initial position as player_name:bot_type:x.y) .")
 @click.option("--no-ui", is_flag=True, help="Don't show the ui, just run the game until the end and inform the winner.")
 @click.option("--ui-turn-delay", type=float, default=0.2, help="Seconds to wait between turns when showing the ui.")
 @click.option("--turn-timeout", type=float, default=0.5, help="Maximum seconds a player can take to think its turn.")
-@click.option("--log-path", type=click.Path(), default="./toe.log", help="Path for the log file of the game.")
+@click.option("--log-path", type=click.Path(), default="./toe.log", help="Path for the log file of the game (numbered for each game when repeating games, unless it has {game} or {seed} placeholders). Logs ending with .gz are gzip compressed.")
+@click.option("--log-format", type=click.Choice(LOG_FORMATS), default="text", help="Format of the log: human readable text, json lines with the events of the game (written in the background, faster), or none at all.")
 @click.option("--max-turns", type=int, default=None, help="Maximum number of turns to play (no limit if not specified).")
 @click.option("--debug", is_flag=True, help="In debug mode, any errors in the bot will stop the game and the traceback will be shown.")
 @click.option("--repeat", type=int, default=1, help="Repeat the game N times and return stats about winners of the games.")
 @click.option("--ignore-bans", is_flag=True, help="Ignore bots banned for being dangerous code.")
-def main(width, height, players, no_ui, ui_turn_delay, log_path, turn_timeout, max_turns, debug, repeat, ignore_bans):
+@click.option("--safe-world-copies", is_flag=True, help="Give bots a full copy of the world each turn instead of a read only view (slower, but safer with untrusted bots).")
+@click.option("--jobs", type=int, default=1, help="Number of games to play in parallel when repeating games (requires --no-ui).")
+@click.option("--seed", type=int, default=None, help="Seed for the random choices of the game (castle placement and turn order). Repeated games use the following seeds.")
+@click.option("--replay-path", type=click.Path(), default=None, help="Save a replay of the game to this path (numbered for each game when repeating games).")
+@click.option("--checkpoint-every", type=int, default=None, help="Save a checkpoint of the game every N turns, to be able to resume it later.")
+@click.option("--checkpoint-path", type=click.Path(), default="./toe.checkpoint", help="Path for the checkpoints of the game (numbered for each game when repeating games).")
+@click.option("--resume", "resume_path", type=click.Path(exists=True, dir_okay=False), default=None, help="Resume a game from a checkpoint (the map and players are the ones of the checkpoint).")
+@click.option("--dataset-path", type=click.Path(file_okay=False), default=None, help="Record the observations, actions and results of the players as a training dataset of .npz shards in this directory.")
+@click.option("--events-db", "events_db_path", type=click.Path(dir_okay=False), default=None, help="Store the events of the games in this SQLite database, to analyze them with the query command.")
+@click.pass_context
+def main(ctx, width, height, players, no_ui, ui_turn_delay, log_path, log_format, turn_timeout, max_turns, debug, repeat, ignore_bans, safe_world_copies, jobs, seed, replay_path, checkpoint_every, checkpoint_path, resume_path, dataset_path, events_db_path):
     """
     Run a game of Terminal of Empires.
 
     Optionally, repeat the game N times and return stats about winners of the games.
     """
+    if ctx.invoked_subcommand is not None:
+        return
+
+    if resume_path:
+        if repeat > 1:
+            print("Only one game can be resumed, --repeat can't be used with --resume.")
+            sys.exit(1)
+    else:
+        players = parse_players(players, ignore_bans)
+
+    if jobs > 1 and not no_ui:
+        print("Parallel games can't show the ui, use --no-ui when using --jobs.")
+        sys.exit(1)
+
+    game_settings = dict(
+        width=width, height=height, players=players, turn_timeout=turn_timeout,
+        max_turns=max_turns, debug=debug, safe_world_copies=safe_world_copies,
+        checkpoint_every=checkpoint_every, resume_path=resume_path, dataset_path=dataset_path,
+        log_format=log_format, events_db_path=events_db_path,
+    )
+
+    def game_seed(game_number):
+        if seed is None:
+            return None
+        return seed + game_number
+
+    def game_path(path, game_number):
+        if path is None:
+            return path
+        if "{game}" in path or "{seed}" in path:
+            game_seed_text = "random" if seed is None else game_seed(game_number)
+            return path.format(game=game_number + 1, seed=game_seed_text)
+        if repeat == 1:
+            return path
+        return numbered_path(path, game_number + 1)
+
     scoreboard = defaultdict(int)
-    for game_number in range(repeat):
-        if no_ui:
-            print(f"Playing game {game_number + 1} of {repeat}...")
-            ui = None
-        else:
-            ui = ToEUI(ui_turn_delay)
-
-        toe = ToE(width, height, ui=ui, log_path=log_path, turn_timeout=turn_timeout, debug=debug)
-
-        for player_info in players.split(","):
-            try:
-                parts = player_info.split(":")
-                if len(parts) == 2:
-                    name, bot_type = player_info.split(":")
-                    castle_position = None
-                elif len(parts) == 3:
-                    name, bot_type, position = player_info.split(":")
-                    x, y = position.split(".")
-                    castle_position = (int(x), int(y))
-                else:
-                    raise ValueError()
-
-                bot_type = bot_type.lower()
-            except ValueError:
-                print(f"Invalid player info: {player_info}. Should be name:bot_type")
-                sys.exit(1)
-
-            if bot_type in BANNED_BOTS and not ignore_bans:
-                print(f"Bot {bot_type} is banned for being dangerous. You can override this with --ignore-bans.")
-                sys.exit(1)
-
-            toe.add_player(name, bot_type, castle_position=castle_position)
-
-        if ui:
-            with ui.show():
-                result = toe.play(max_turns=max_turns)
-        else:
-            result = toe.play(max_turns=max_turns)
-
-        if result:
-            winners, turns_played = result
-            print("Game", game_number + 1, "ended in", turns_played, "turns!")
-            print("Winners:", ",".join(player.name for player in winners))
-            score = 1 / len(winners)
-            for winner in winners:
-                scoreboard[winner.name] += score
+
+    def register_result(result):
+        print("Game", result.game_number + 1, "ended in", result.turns_played, "turns!")
+        print("Winners:", ",".join(result.winners))
+        for winner in result.winners:
+            scoreboard[winner] += 1 / len(result.winners)
+
+    if jobs > 1:
+        print(f"Playing {repeat} games using {jobs} parallel jobs...")
+        games = [
+            dict(
+                game_settings,
+                game_number=game_number,
+                log_path=game_path(log_path, game_number),
+                seed=game_seed(game_number),
+                replay_path=game_path(replay_path, game_number),
+                checkpoint_path=game_path(checkpoint_path, game_number),
+            )
+            for game_number in range(repeat)
+        ]
+
+        start_time = monotonic()
+        for games_played, result in enumerate(run_games_in_parallel(games, jobs), start=1):
+            register_result(result)
+
+            elapsed = monotonic() - start_time
+            games_per_minute = games_played / elapsed * 60
+            eta = (repeat - games_played) * elapsed / games_played
+            print(f"Played {games_played} of {repeat} games ({games_per_minute:.1f} games/min, ETA {eta:.0f} seconds)")
+            print()
+    else:
+        for game_number in range(repeat):
+            if no_ui:
+                print(f"Playing game {game_number + 1} of {repeat}...")
+                ui = None
+            else:
+                ui = ToEUI(ui_turn_delay)
+
+            result = run_game(
+                game_number, log_path=game_path(log_path, game_number), ui=ui, seed=game_seed(game_number),
+                replay_path=game_path(replay_path, game_number),
+                checkpoint_path=game_path(checkpoint_path, game_number), **game_settings,
+            )
+            register_result(result)
             print()
 
     if repeat > 1:
@@ -82,5 +130,71 @@ def main(width, height, players, no_ui, ui_turn_delay, log_path, turn_timeout, m
             print(f"{player}: {score}")
 
 
+@main.command()
+@click.argument("question", type=click.Choice(["failures", "resources"]))
+@click.option("--events-db", "events_db_path", type=click.Path(exists=True, dir_okay=False), default="./toe.sqlite", help="SQLite database with the events of the games.")
+@click.option("--game", "game_id", type=int, default=None, help="Game to query (the last one stored if not specified).")
+@click.option("--every", type=int, default=10, help="Show the resources every N turns.")
+def query(question, events_db_path, game_id, every):
+    """
+    Answer common questions about the games stored with --events-db:
+
+    failures: rate of failed actions of each bot type, in all the games.
+
+    resources: resources of each player over the turns of a game.
+    """
+    store = EventStore(events_db_path)
+    try:
+        if question == "failures":
+            print("bot type | actions | failed | failure rate")
+            for bot_type, actions, failed in store.failure_rates():
+                print(f"{bot_type} | {actions} | {failed} | {failed / actions:.1%}")
+        else:
+            if game_id is None:
+                game_id = store.latest_game_id()
+                if game_id is None:
+                    print("There are no games in the events database.")
+                    sys.exit(1)
+
+            print(f"Resources in game {game_id}:")
+            print("turn | player | resources")
+            for turn, player, resources in store.resources_over_time(game_id, every):
+                print(f"{turn} | {player} | {resources}")
+    finally:
+        store.close()
+
+
+def parse_players(players, ignore_bans):
+    """
+    Parse the players specification into a list of (name, bot_type, castle_position) tuples.
+    """
+    parsed_players = []
+    for player_info in players.split(","):
+        try:
+            parts = player_info.split(":")
+            if len(parts) == 2:
+                name, bot_type = player_info.split(":")
+                castle_position = None
+            elif len(parts) == 3:
+                name, bot_type, position = player_info.split(":")
+                x, y = position.split(".")
+                castle_position = (int(x), int(y))
+            else:
+                raise ValueError()
+
+            bot_type = bot_type.lower()
+        except ValueError:
+            print(f"Invalid player info: {player_info}. Should be name:bot_type")
+            sys.exit(1)
+
+        if bot_type in BANNED_BOTS and not ignore_bans:
+            print(f"Bot {bot_type} is banned for being dangerous. You can override this with --ignore-bans.")
+            sys.exit(1)
+
+        parsed_players.append((name, bot_type, castle_position))
+
+    return parsed_players
+
+
 if __name__ == '__main__':
     main()
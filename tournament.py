@@ -0,0 +1,288 @@
+import hashlib
+import os
+import sqlite3
+import sys
+from collections import defaultdict, namedtuple
+from datetime import datetime
+from itertools import combinations
+from pathlib import Path
+
+import click
+
+from runner import numbered_path, run_games_in_parallel
+from toe import BANNED_BOTS
+
+BOTS_DIR = Path(__file__).parent / "bots"
+BOT_DIRS = (BOTS_DIR, BOTS_DIR / "pycamp_2025")
+
+ROUND_ROBIN = "round-robin"
+SWISS = "swiss"
+
+Bot = namedtuple("Bot", "bot_type source_hash")
+Board = namedtuple("Board", "width height seed")
+
+
+def discover_bots():
+    """
+    Find all the bot types in the bots directories.
+    """
+    bot_types = []
+    for bot_dir in BOT_DIRS:
+        prefix = "" if bot_dir == BOTS_DIR else f"{bot_dir.name}."
+        for bot_path in sorted(bot_dir.glob("*.py")):
+            if bot_path.stem != "__init__":
+                bot_types.append(prefix + bot_path.stem)
+
+    return bot_types
+
+
+def bot_source_hash(bot_type):
+    """
+    Hash of the source code of a bot, so results are recomputed when the bot changes.
+    """
+    bot_path = BOTS_DIR.joinpath(*bot_type.split(".")).with_suffix(".py")
+    return hashlib.sha256(bot_path.read_bytes()).hexdigest()
+
+
+def matchup_key(bots):
+    """
+    Key identifying the opponents of a game, in the order they are added to it (their seats), and
+    including the versions of their code.
+    """
+    return ",".join(f"{bot.bot_type}@{bot.source_hash}" for bot in bots)
+
+
+class ResultsStore:
+    """
+    Local SQLite database with the results of the tournament games, so games that were already
+    played (with the same bot versions and seats, seed, map size and turn limits) aren't played
+    again.
+    """
+    def __init__(self, db_path):
+        self.connection = sqlite3.connect(db_path)
+        # results of older versions of the store (the "games" table) don't have the turn limits, so
+        # they are ignored
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                matchup TEXT NOT NULL,
+                seed INTEGER NOT NULL,
+                width INTEGER NOT NULL,
+                height INTEGER NOT NULL,
+                max_turns INTEGER NOT NULL,
+                turn_timeout REAL NOT NULL,
+                winners TEXT NOT NULL,
+                turns_played INTEGER NOT NULL,
+                played_at TEXT NOT NULL,
+                PRIMARY KEY (matchup, seed, width, height, max_turns, turn_timeout)
+            )
+        """)
+        self.connection.commit()
+
+    def get(self, bots, board, max_turns, turn_timeout):
+        """
+        Get the winners (bot types) of an already played game, or None if it wasn't played yet.
+        """
+        row = self.connection.execute(
+            "SELECT winners FROM results WHERE matchup = ? AND seed = ? AND width = ? AND height = ? "
+            "AND max_turns = ? AND turn_timeout = ?",
+            (matchup_key(bots), board.seed, board.width, board.height, max_turns, turn_timeout),
+        ).fetchone()
+        if row is None:
+            return None
+        return [winner for winner in row[0].split(",") if winner]
+
+    def save(self, bots, board, max_turns, turn_timeout, winners, turns_played):
+        """
+        Save the result of a game.
+        """
+        self.connection.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (matchup_key(bots), board.seed, board.width, board.height, max_turns, turn_timeout,
+             ",".join(winners), turns_played, datetime.now().isoformat()),
+        )
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+class Tournament:
+    """
+    A tournament between bots, played over many boards (map sizes and seeds).
+    Each pairing of bots plays a game on every board, and each game gives 1 point to its winner
+    (split if there are many winners).
+    """
+    def __init__(self, bots, boards, store, jobs, turn_timeout, max_turns, log_dir):
+        self.bots = bots
+        self.boards = boards
+        self.store = store
+        self.jobs = jobs
+        self.turn_timeout = turn_timeout
+        self.max_turns = max_turns
+        self.log_dir = log_dir
+
+        self.points = defaultdict(float)
+        self.games_played = defaultdict(int)
+        self.played_pairings = set()
+        self.games_count = 0
+
+    def play_pairings(self, pairings):
+        """
+        Play all the boards of the given pairings, reusing stored results when possible.
+        """
+        pending_games = []
+        pending_info = {}
+
+        for pairing in pairings:
+            self.played_pairings.add(frozenset(bot.bot_type for bot in pairing))
+
+            for board in self.boards:
+                winners = self.store.get(pairing, board, self.max_turns, self.turn_timeout)
+                if winners is not None:
+                    self.register_result(pairing, winners)
+                    continue
+
+                self.games_count += 1
+                pending_info[self.games_count] = (pairing, board)
+                pending_games.append(dict(
+                    game_number=self.games_count,
+                    width=board.width,
+                    height=board.height,
+                    seed=board.seed,
+                    players=[(bot.bot_type, bot.bot_type, None) for bot in pairing],
+                    log_path=numbered_path(os.path.join(self.log_dir, "toe.log"), self.games_count),
+                    turn_timeout=self.turn_timeout,
+                    max_turns=self.max_turns,
+                ))
+
+        print(f"Playing {len(pending_games)} new games ({len(pairings) * len(self.boards) - len(pending_games)} already in the results store)...")
+        for result in run_games_in_parallel(pending_games, self.jobs):
+            pairing, board = pending_info.pop(result.game_number)
+            self.store.save(pairing, board, self.max_turns, self.turn_timeout, result.winners, result.turns_played)
+            self.register_result(pairing, result.winners)
+            print(f"{' vs '.join(bot.bot_type for bot in pairing)} on {board.width}x{board.height} (seed {board.seed}): won by {','.join(result.winners)} in {result.turns_played} turns")
+
+    def register_result(self, pairing, winners):
+        """
+        Update the points with the result of a game.
+        """
+        for bot in pairing:
+            self.games_played[bot.bot_type] += 1
+        for winner in winners:
+            self.points[winner] += 1 / len(winners)
+
+    def play_round_robin(self):
+        """
+        Every bot plays against every other bot.
+        """
+        self.play_pairings(list(combinations(self.bots, 2)))
+
+    def play_swiss(self, rounds):
+        """
+        On each round, bots play against opponents with similar points that they haven't faced yet.
+        """
+        for round_number in range(1, rounds + 1):
+            print(f"Swiss round {round_number} of {rounds}")
+            pairings = self.swiss_pairings()
+            if not pairings:
+                print("No more pairings to play")
+                break
+            self.play_pairings(pairings)
+
+    def swiss_pairings(self):
+        """
+        Pair bots by their current points, avoiding repeated pairings (one bot may get a bye).
+        """
+        unpaired = sorted(self.bots, key=lambda bot: self.points[bot.bot_type], reverse=True)
+        pairings = []
+        while unpaired:
+            bot = unpaired.pop(0)
+            for opponent in unpaired:
+                if frozenset((bot.bot_type, opponent.bot_type)) not in self.played_pairings:
+                    unpaired.remove(opponent)
+                    pairings.append((bot, opponent))
+                    break
+
+        return pairings
+
+    def print_ranking(self):
+        """
+        Print the ranking of the bots.
+        """
+        print("Ranking:")
+        ranking = sorted(self.bots, key=lambda bot: self.points[bot.bot_type], reverse=True)
+        for position, bot in enumerate(ranking, start=1):
+            games = self.games_played[bot.bot_type]
+            points = self.points[bot.bot_type]
+            win_rate = points / games if games else 0
+            print(f"{position}. {bot.bot_type}: {points:.1f} points in {games} games ({win_rate:.0%} win rate)")
+
+
+def parse_map_sizes(map_sizes):
+    """
+    Parse a comma separated list of WIDTHxHEIGHT map sizes.
+    """
+    try:
+        return [tuple(int(side) for side in map_size.split("x")) for map_size in map_sizes.split(",")]
+    except ValueError:
+        print(f"Invalid map sizes: {map_sizes}. Should be a comma separated list of WIDTHxHEIGHT")
+        sys.exit(1)
+
+
+@click.command()
+@click.option("--bots", type=str, default=None, help="Comma separated list of bot types to rank (all the bots in bots/ and bots/pycamp_2025/ if not specified).")
+@click.option("--format", "tournament_format", type=click.Choice([ROUND_ROBIN, SWISS]), default=ROUND_ROBIN, help="Format of the tournament.")
+@click.option("--rounds", type=int, default=5, help="Number of rounds of a swiss tournament.")
+@click.option("--map-sizes", type=str, default="40x20", help="Comma separated list of map sizes (WIDTHxHEIGHT) to play on.")
+@click.option("--seeds", type=int, default=3, help="Number of seeds (different initial positions) to play on each map size.")
+@click.option("--jobs", type=int, default=os.cpu_count(), help="Number of games to play in parallel.")
+@click.option("--turn-timeout", type=float, default=0.5, help="Maximum seconds a player can take to think its turn.")
+@click.option("--max-turns", type=int, default=1000, help="Maximum number of turns of each game.")
+@click.option("--db-path", type=click.Path(), default="./tournament.sqlite", help="Path of the results store.")
+@click.option("--log-dir", type=click.Path(file_okay=False), default="./tournament_logs", help="Directory for the log files of the games.")
+@click.option("--ignore-bans", is_flag=True, help="Ignore bots banned for being dangerous code.")
+def main(bots, tournament_format, rounds, map_sizes, seeds, jobs, turn_timeout, max_turns, db_path, log_dir, ignore_bans):
+    """
+    Rank bots by playing a tournament between them.
+
+    Results are stored, so running the tournament again only plays the games of new or changed bots.
+    """
+    if bots:
+        bot_types = [bot_type.lower() for bot_type in bots.split(",")]
+    else:
+        bot_types = discover_bots()
+
+    if not ignore_bans:
+        bot_types = [bot_type for bot_type in bot_types if bot_type.split(".")[-1] not in BANNED_BOTS]
+
+    boards = [
+        Board(width, height, seed)
+        for width, height in parse_map_sizes(map_sizes)
+        for seed in range(seeds)
+    ]
+
+    os.makedirs(log_dir, exist_ok=True)
+    store = ResultsStore(db_path)
+    tournament = Tournament(
+        bots=[Bot(bot_type, bot_source_hash(bot_type)) for bot_type in bot_types],
+        boards=boards,
+        store=store,
+        jobs=jobs,
+        turn_timeout=turn_timeout,
+        max_turns=max_turns,
+        log_dir=log_dir,
+    )
+
+    try:
+        if tournament_format == ROUND_ROBIN:
+            tournament.play_round_robin()
+        else:
+            tournament.play_swiss(rounds)
+    finally:
+        store.close()
+
+    tournament.print_ranking()
+
+
+if __name__ == "__main__":
+    main()
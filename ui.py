@@ -83,27 +83,18 @@ class ToEUI:
         Render the status of the players.
         """
         print("Turn", turn_number, "| Stats:", self.term.clear_eol)
-        player_stats = {
-            player.name: {CASTLE: 0, FARM: 0, FORT: 0, "tiles": 0}
-            for player in toe.players.values()
-        }
-
-        for terrain in toe.world.values():
-            if terrain.owner is not None:
-                player_stats[terrain.owner]["tiles"] += 1
-                if terrain.structure in (FARM, FORT, CASTLE):
-                    player_stats[terrain.owner][terrain.structure] += 1
 
+        # the world keeps these counters up to date, no need to scan it
         total_tiles = toe.map_size.x * toe.map_size.y
         for player in toe.players.values():
-            tiles = len([t for t in toe.world.values() if t.owner == player.name])
-            percent = int((tiles / total_tiles) * 100)
+            player_stats = toe.world.stats(player.name)
+            percent = int((player_stats.tiles / total_tiles) * 100)
             stats = (
                 f"{player.resources}$ "
-                f"{player_stats[player.name][CASTLE]}[] "
-                f"{player_stats[player.name][FARM]}// "
-                f"{player_stats[player.name][FORT]}<> "
-                f"{player_stats[player.name]['tiles']}t "
+                f"{player_stats.castles}[] "
+                f"{player_stats.farms}// "
+                f"{player_stats.forts}<> "
+                f"{player_stats.tiles}t "
                 f"{percent}%"
                 f"{self.term.clear_eol}"
             )